@@ -16,10 +16,13 @@ For detail about GNU see <http://www.gnu.org/licenses/>.
 
 from .grib import Grib
 from .gribmanager import GribManager
+from .polartable import PolarTable, PolarRegistry, polarRegistry
 from .timecontrol import TimeControl
 from .datasource import DataSource, NMEADataPacket, DataPacket
 from .serialdatasource import SerialDataSource
 from .networkdatasource import NetworkDataSource
 from .connectionmanager import ConnectionManager
 from .core import Core
-from .utils import DictCache, EventDispatcher
+from .isochronerouter import IsochroneRouter
+from .routers import listRoutingAlgorithms, createRouting
+from .utils import DictCache, LRUCache, EventDispatcher
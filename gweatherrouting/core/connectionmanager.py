@@ -41,6 +41,7 @@ class ConnectionManagerStorage(Storage):
 
 class ConnectionManager(EventDispatcher):
 	def __init__(self):
+		EventDispatcher.__init__(self)
 		self.storage = ConnectionManagerStorage()
 		self.running = True
 		self.sources = {}
@@ -13,10 +13,8 @@ GNU General Public License for more details.
 
 For detail about GNU see <http://www.gnu.org/licenses/>.
 """
-import os
 import logging
 import gpxpy
-import weatherrouting
 
 from . import utils
 
@@ -24,6 +22,8 @@ from .connectionmanager import ConnectionManager
 from .datasource import DataPacket
 
 from . import GribManager
+from .routers import createRouting
+from .routingrunner import RoutingRunner, sweepJobs, sweepTable
 from .utils import EventDispatcher
 from .geo import TrackCollection, RoutingCollection, POICollection
 
@@ -48,11 +48,12 @@ class BoatInfo:
 
 class Core(EventDispatcher):
 	def __init__(self):
+		EventDispatcher.__init__(self)
 		self.connectionManager = ConnectionManager()
 		self.trackManager = TrackCollection()
 		self.routingManager = RoutingCollection()
 		self.poiManager = POICollection()
-		self.gribManager = GribManager()
+		self.gribManager = GribManager(warmup=True)
 		self.boatInfo = BoatInfo()
 
 		self.connectionManager.connect("data", self.dataHandler)
@@ -78,8 +79,6 @@ class Core(EventDispatcher):
 
 	# Simulation
 	def createRouting(self, algorithm, polarFile, track, startDatetime, startPosition, validityProviders, disableCoastlineChecks=False):
-		polar = weatherrouting.Polar (os.path.abspath(os.path.dirname(__file__)) + '/../data/polars/' + polarFile)
-
 		pval = utils.pointsValidity
 		lval = None
 
@@ -93,17 +92,26 @@ class Core(EventDispatcher):
 			lval = None
 			pval = None
 
-		routing = weatherrouting.Routing(
-			algorithm,
-			polar,
-			track,
-			self.gribManager,
-			startDatetime=startDatetime,
-			startPosition=startPosition,
-			pointsValidity=pval,
-			linesValidity=lval
-		)
-		return routing
+		return createRouting(algorithm, polarFile, track, self.gribManager, startDatetime,
+			startPosition=startPosition, pointsValidity=pval, linesValidity=lval)
+
+	# Route track at every departure time of starts, over a process pool which
+	# shares the decoded wind of the opened gribs; return the comparison table rows
+	# (see routingrunner.sweepTable). Custom validity providers are not picklable,
+	# so the workers check coastlines with the builtin one.
+	def sweepDepartures(self, algorithm, polarFile, track, starts, startPosition=None, disableCoastlineChecks=False,
+			workers=None, callback=None):
+		job = {
+			'name': 'sweep',
+			'gribs': [x.path for x in self.gribManager.gribs],
+			'polar': polarFile,
+			'algorithm': algorithm.__name__,
+			'params': { k: p.value for k, p in algorithm.PARAMS.items() },
+			'track': [list(x) for x in track],
+			'startPosition': list(startPosition) if startPosition else None,
+			'coastlineChecks': not disableCoastlineChecks
+		}
+		return sweepTable(RoutingRunner(workers).run(sweepJobs(job, starts), callback))
 
 	# Import a GPX file (tracks, pois and routings)
 	def importGPX(self, path):
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import time
+import logging
+import threading
+import collections
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import urllib3
+
+from .utils import EventDispatcher
+
+logger = logging.getLogger ('gweatherrouting')
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+# Yield the body of a streamed response in chunks sized on the measured
+# throughput (about 1/4 s of data per chunk)
+def adaptiveChunks(response, target=0.25):
+	size = MIN_CHUNK_SIZE
+
+	while True:
+		t0 = time.time()
+		try:
+			data = response.raw.read(size, decode_content=True)
+		except (urllib3.exceptions.ProtocolError, urllib3.exceptions.ReadTimeoutError) as e:
+			raise requests.exceptions.ChunkedEncodingError(e)
+
+		if not data:
+			return
+		yield data
+
+		rate = len(data) / max(time.time() - t0, 0.001)
+		size = int(min(MAX_CHUNK_SIZE, max(MIN_CHUNK_SIZE, rate * target)))
+
+
+class DownloadJob:
+	def __init__(self, uri):
+		self.uri = uri
+		self.host = urlparse(uri).netloc
+		self.percentage = 0
+		self.status = 'queued'
+		self.cancelled = threading.Event()
+		self.future = None
+
+	def cancel(self):
+		self.cancelled.set()
+
+
+class DownloadManager(EventDispatcher):
+	""" Download queue for gribs: a bounded worker pool with a per-host concurrency
+	limit; a URI already queued or downloading is not enqueued twice.
+
+	Jobs wait in per-host queues and are submitted to the pool only when their host
+	has a free slot, so a busy host does not hold the workers needed by the others.
+
+	Dispatched events: 'download-progress' (job), 'download-completed' (job)
+	and 'downloads-progress' with the aggregate percentage of the active jobs.
+	"""
+
+	def __init__(self, gribManager, workers=4, perHost=2):
+		EventDispatcher.__init__(self)
+		self.gribManager = gribManager
+		self.perHost = perHost
+		self.executor = ThreadPoolExecutor(max_workers=workers)
+		self.lock = threading.Lock()
+		self.hosts = {}
+		self.queues = {}
+		self.jobs = {}
+
+	def enqueue(self, uri):
+		with self.lock:
+			if uri in self.jobs:
+				return self.jobs[uri]
+
+			job = DownloadJob(uri)
+			self.jobs[uri] = job
+			self.queues.setdefault(job.host, collections.deque()).append(job)
+			self._schedule(job.host)
+		return job
+
+	# Submit the queued jobs of host while it has free slots; called holding the lock
+	def _schedule(self, host):
+		queue = self.queues.get(host)
+		while queue and self.hosts.get(host, 0) < self.perHost:
+			job = queue.popleft()
+			self.hosts[host] = self.hosts.get(host, 0) + 1
+			job.future = self.executor.submit(self._run, job)
+
+		if not queue:
+			self.queues.pop(host, None)
+
+	def cancel(self, uri):
+		with self.lock:
+			job = self.jobs.get(uri)
+		if job:
+			self._cancel(job)
+
+	def cancelAll(self):
+		with self.lock:
+			jobs = list(self.jobs.values())
+		for x in jobs:
+			self._cancel(x)
+
+	# A job still waiting in its host queue is removed at once, a running one stops
+	# at its next chunk
+	def _cancel(self, job):
+		job.cancel()
+		with self.lock:
+			queue = self.queues.get(job.host)
+			if not queue or job not in queue:
+				return
+			queue.remove(job)
+			if not queue:
+				self.queues.pop(job.host, None)
+			del self.jobs[job.uri]
+
+		job.status = 'cancelled'
+		self.dispatch('download-completed', job)
+
+	def getJobs(self):
+		with self.lock:
+			return list(self.jobs.values())
+
+	def isDownloading(self):
+		return len(self.jobs) > 0
+
+	# Aggregate percentage of the active jobs
+	def getProgress(self):
+		jobs = self.getJobs()
+		if len(jobs) == 0:
+			return 100
+		return int(sum(x.percentage for x in jobs) / len(jobs))
+
+	def _onPercentage(self, job, percentage):
+		job.percentage = percentage
+		self.dispatch('download-progress', job)
+		self.dispatch('downloads-progress', self.getProgress())
+
+	def _run(self, job):
+		status = False
+		if not job.cancelled.is_set():
+			job.status = 'downloading'
+			try:
+				status = self.gribManager.download(job.uri, lambda p: self._onPercentage(job, p),
+					lambda s: None, cancelled=job.cancelled)
+			except Exception as e:
+				logger.error('Download of %s failed: %s', job.uri, str(e))
+
+		if job.cancelled.is_set():
+			job.status = 'cancelled'
+		else:
+			job.status = 'completed' if status else 'failed'
+
+		with self.lock:
+			del self.jobs[job.uri]
+			self.hosts[job.host] -= 1
+			self._schedule(job.host)
+
+		self.dispatch('download-completed', job)
+		return status
@@ -14,190 +14,622 @@ GNU General Public License for more details.
 
 For detail about GNU see <http://www.gnu.org/licenses/>.
 '''
+import mmap
 import logging
 import math
+import bisect
 import datetime
+import threading
+import itertools
+import collections
+import numpy
 
 import weatherrouting
 from . import utils
+from .gribcache import GribCache
 
 logger = logging.getLogger ('gweatherrouting')
 
+# Memory budgets of the decoded data kept in memory, shared by all the gribs
+STEP_CACHE_BYTES = 512 * 1024 * 1024
+LEVEL_CACHE_BYTES = 128 * 1024 * 1024
+GRID_CACHE_BYTES = 128 * 1024 * 1024
+
+# Number of decimated levels (2x, 4x, 8x) built for each decoded step
+PYRAMID_LEVELS = 3
+
+WIND_U = '10 metre U wind component'
+WIND_V = '10 metre V wind component'
+
+MS_TO_KNOTS = 1.943844
+
+
+# Convert U/V components in m/s (scalars or numpy arrays) to (twd degrees, tws knots)
+def uvToWind(u, v):
+	tws = numpy.sqrt(u * u + v * v) * MS_TO_KNOTS
+	twd = numpy.degrees(numpy.mod(numpy.arctan2(u, v) + math.pi, 2 * math.pi))
+	return twd, tws
+
+
+# Precomputed (u, v, twd, tws) float32 arrays of a decoded step
+def stepWind(u, v):
+	twd, tws = uvToWind(u, v)
+	return u, v, twd.astype(numpy.float32), tws.astype(numpy.float32)
+
+
+# West and east longitudes of bounds ((lat1, lon1), (lat2, lon2)); a box crossing
+# the antimeridian has lon1 > lon2 and gets an east side past 180
+def boundsLons(bounds):
+	lon1 = bounds[0][1]
+	lon2 = bounds[1][1]
+	if lon2 < lon1:
+		lon2 += 360.
+	return lon1, lon2
+
+
+# Split a point stride into the pyramid level covering it and the stride left to
+# apply on that level
+def pyramidLevel(stride):
+	level = 0
+	while level < PYRAMID_LEVELS and stride >= 2**(level + 1):
+		level += 1
+	return level, max(1, stride // 2**level)
+
+
+class GribFilePool:
+	""" Small thread-safe pool keeping one read-only mmap per grib file.
+
+	Wind messages are read by their byte offset and length, so only the pages of
+	the requested messages are touched, and decoded with codes_new_from_message;
+	message handles are released right after their values are read. The least
+	recently used map is closed when the pool is full.
+	"""
+
+	def __init__(self, maxSize=8):
+		self.maxSize = maxSize
+		self.lock = threading.Lock()
+		self.files = collections.OrderedDict()
+		self.opened = 0
+		self.handles = 0
+		self.handlesCreated = 0
+
+	# Return the bytes [offset, offset + length) of the file at path
+	def read(self, path, offset, length):
+		with self.lock:
+			if path in self.files:
+				self.files.move_to_end(path)
+			else:
+				with open(path, 'rb') as f:
+					self.files[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+				self.opened += 1
+
+				while len(self.files) > self.maxSize:
+					self.files.popitem(last=False)[1].close()
+
+			return self.files[path][offset:offset + length]
+
+	# Decode the message at offset and return its values
+	def readValues(self, path, offset, length):
+		import eccodes
+
+		gid = eccodes.codes_new_from_message(self.read(path, offset, length))
+
+		with self.lock:
+			self.handles += 1
+			self.handlesCreated += 1
+
+		try:
+			return eccodes.codes_get_values(gid)
+		finally:
+			eccodes.codes_release(gid)
+			with self.lock:
+				self.handles -= 1
+
+	# Close the map of path (ie: when the grib is removed or replaced)
+	def release(self, path):
+		with self.lock:
+			mm = self.files.pop(path, None)
+			if mm:
+				mm.close()
+
+	def stats(self):
+		with self.lock:
+			return {
+				'files': len(self.files),
+				'filesOpened': self.opened,
+				'handles': self.handles,
+				'handlesCreated': self.handlesCreated
+			}
+
+
+filePool = GribFilePool()
+
+
+class GribDataCache:
+	""" Process wide caches of the decoded wind of all the gribs, so the memory
+	budget does not grow with the number of opened gribs.
+
+	Full resolution steps, pyramid levels and 2D wind grids have separate LRU
+	caches (and budgets), so the small pyramid entries do not evict full
+	resolution steps. Keys start with the id of the owning Grib.
+	"""
+
+	def __init__(self):
+		self.ids = itertools.count()
+		self.steps = utils.LRUCache(64, STEP_CACHE_BYTES)
+		self.levels = utils.LRUCache(64 * PYRAMID_LEVELS, LEVEL_CACHE_BYTES)
+		self.grids = utils.LRUCache(128, GRID_CACHE_BYTES)
+
+	def newId(self):
+		return next(self.ids)
+
+	# Drop all the entries of a grib (ie: when it is removed or replaced)
+	def release(self, gid):
+		for c in (self.steps, self.levels, self.grids):
+			with c.lock:
+				for k in [k for k in c.entries if k[0] == gid]:
+					del c[k]
+
+	def stats(self):
+		return { 'steps': self.steps.stats(), 'levels': self.levels.stats(), 'grids': self.grids.stats() }
+
+
+dataCache = GribDataCache()
+
+
 class MetaGrib:
-	def __init__(self, path, name, centre, bounds, startTime, lastForecast):
+	def __init__(self, path, name, centre, bounds, startTime, lastForecast, messages=0, resolution=None, firstForecast=0):
 		self.name = name
 		self.centre = centre.upper()
 		self.bounds = bounds
 		self.startTime = startTime
+		self.firstForecast = firstForecast
 		self.lastForecast = lastForecast
+		self.messages = messages
+		self.resolution = resolution
 		self.path = path
 
+	def toDict(self):
+		return {
+			'name': self.name,
+			'centre': self.centre,
+			'bounds': self.bounds,
+			'startTime': self.startTime.isoformat() if self.startTime else None,
+			'firstForecast': self.firstForecast,
+			'lastForecast': self.lastForecast,
+			'messages': self.messages,
+			'resolution': self.resolution
+		}
 
-class Grib(weatherrouting.Grib):
-	def __init__ (self, path, name, centre, bounds, rindex, startTime, lastForecast, timeKey):
-		self.name = name
-		self.centre = centre.upper()
-		self.cache = utils.DictCache(16)
-		self.rindex_data = utils.DictCache(16)
-		self.rindex = rindex
-		self.bounds = bounds
-		self.startTime = startTime
-		self.lastForecast = lastForecast
-		self.path = path
-		self.timeKey = timeKey
+	@staticmethod
+	def fromDict(path, d):
+		startTime = datetime.datetime.fromisoformat(d['startTime']) if d['startTime'] else None
+		return MetaGrib(path, d['name'], d['centre'], d['bounds'], startTime, d['lastForecast'], d['messages'],
+			d.get('resolution'), d.get('firstForecast', 0))
+
+
+class GribGrid:
+	""" Regular lat/lon grid with ascending lat and lon axes.
+
+	The lon axis starts in [-180, 180) and is kept contiguous: a regional grid
+	crossing the antimeridian goes past 180 (ie: 170 .. 190), while a global grid
+	spans [-180, 180) and wraps around.
+	"""
+
+	def __init__(self, lats, lons):
+		nlons = numpy.mod(lons + 180., 360.) - 180.
+		self.latOrder = numpy.argsort(lats, kind='stable')
+		self.lonOrder = numpy.argsort(nlons, kind='stable')
+		self.lats = lats[self.latOrder]
+		self.lons = nlons[self.lonOrder]
+
+		# If the widest gap between points is not the one across 180, the grid
+		# crosses the antimeridian: rotate the axis to start after that gap
+		if len(self.lons) > 1:
+			gaps = numpy.diff(self.lons)
+			k = int(numpy.argmax(gaps))
+			if gaps[k] > self.lons[0] + 360. - self.lons[-1] + 1e-6:
+				self.lonOrder = numpy.roll(self.lonOrder, -(k + 1))
+				self.lons = numpy.concatenate((self.lons[k + 1:], self.lons[:k + 1] + 360.))
+
+		self.shape = (len(lats), len(lons))
+		self.sorted = (self.latOrder == numpy.arange(len(lats))).all() and (self.lonOrder == numpy.arange(len(lons))).all()
+
+		# Axes origin and step, used for O(1) point lookups
+		self.lat0 = float(self.lats[0])
+		self.lon0 = float(self.lons[0])
+		self.dlat = float(self.lats[-1] - self.lats[0]) / max(1, self.shape[0] - 1)
+		self.dlon = float(self.lons[-1] - self.lons[0]) / max(1, self.shape[1] - 1)
+		self.wrap = abs(self.dlon * self.shape[1] - 360.) < 1e-6
+
+	# Axes as stored in the grib message, used to serialize the grid
+	def toDict(self):
+		lats = numpy.empty(self.shape[0])
+		lons = numpy.empty(self.shape[1])
+		lats[self.latOrder] = self.lats
+		lons[self.lonOrder] = self.lons
+		return { 'lats': lats.tolist(), 'lons': lons.tolist() }
 
+	@staticmethod
+	def fromDict(d):
+		return GribGrid(numpy.array(d['lats']), numpy.array(d['lons']))
 
-	def getRIndexData(self, t):
+	@staticmethod
+	def fromMessage(gid):
 		import eccodes
-		if t in self.rindex_data:
-			return self.rindex_data[t]
-
-		iid = eccodes.codes_index_read(self.path + '.idx')
-		eccodes.codes_index_select(iid, 'name', '10 metre U wind component')
-		eccodes.codes_index_select(iid, self.timeKey, t)
-		gid = eccodes.codes_new_from_index(iid)
-		u = eccodes.codes_grib_get_data(gid)
+		nj = eccodes.codes_get(gid, 'Nj')
+		ni = eccodes.codes_get(gid, 'Ni')
+		lats = eccodes.codes_get_array(gid, 'latitudes').reshape(nj, ni)[:, 0]
+		lons = eccodes.codes_get_array(gid, 'longitudes').reshape(nj, ni)[0, :]
+		return GribGrid(lats, lons)
+
+	def getBounds(self):
+		return [float(self.lats[0]), float(self.lons[0]), float(self.lats[-1]), float(self.lons[-1])]
+
+	def getResolution(self):
+		return max(abs(self.dlat), abs(self.dlon))
+
+	# Reorder the flat values of a message to the (lat, lon) ascending layout
+	def decode(self, values):
+		values = numpy.asarray(values, dtype=numpy.float32).reshape(self.shape)
+		if self.sorted:
+			return values
+		return values[numpy.ix_(self.latOrder, self.lonOrder)]
+
+	# Return the grid cell (i, j, i2, j2, fi, fj) containing the point, or None if outside
+	def locate(self, lat, lon):
+		nlat, nlon = self.shape
+		if nlat < 2 or nlon < 2:
+			return None
 
-		eccodes.codes_index_select(iid, 'name', '10 metre V wind component')
-		eccodes.codes_index_select(iid, self.timeKey, t)
-		gid = eccodes.codes_new_from_index(iid)
-		v = eccodes.codes_grib_get_data(gid)
+		fi = (lat - self.lat0) / self.dlat
+		if fi < 0 or fi > nlat - 1:
+			return None
 
-		self.rindex_data[t] = (u,v)
-		return u,v
+		fj = ((lon - self.lon0) % 360.) / self.dlon
+		if fj > nlon - 1:
+			if not self.wrap:
+				return None
+			fj = fj % nlon
 
+		i = min(int(fi), nlat - 2)
+		j = int(fj)
+		if j >= nlon - 1 and not self.wrap:
+			j = nlon - 2
 
-	# Get Wind data from cache if available (speed up the entire simulation)
-	def _getWindDataCached (self, t, bounds):
-		h = ('%f%f%f%f%f' % (t, bounds[0][0], bounds[0][1], bounds[1][0], bounds[1][1]))
+		return (i, j, i + 1, (j + 1) % nlon, fi - i, fj - j)
 
-		if h in self.cache:
-			return self.cache [h]
+	# Bilinear interpolation of the 2D array a inside a cell returned by locate
+	@staticmethod
+	def interpolate(a, cell):
+		i, j, i2, j2, fi, fj = cell
+		return (a.item(i, j) * (1 - fi) + a.item(i2, j) * fi) * (1 - fj) + \
+			(a.item(i, j2) * (1 - fi) + a.item(i2, j2) * fi) * fj
+
+	# Vectorized locate: return (i, j, i2, j2, fi, fj, valid) arrays for the given points
+	def locateBatch(self, lats, lons):
+		nlat, nlon = self.shape
+		fi = (lats - self.lat0) / self.dlat
+		fj = numpy.mod(lons - self.lon0, 360.) / self.dlon
+
+		valid = (fi >= 0) & (fi <= nlat - 1) & (nlat > 1) & (nlon > 1)
+		if self.wrap:
+			fj = numpy.mod(fj, nlon)
 		else:
-			try:
-				u, v = self.getRIndexData (t)
-			except Exception as _:
-				pass #print('Get wind data cached exception: ', e)
-
-			uu1, latuu, lonuu = [],[],[]
-			vv1, latvv, lonvv = [],[],[]
+			valid &= fj <= nlon - 1
 
-			for x in u:
-				if x['lat'] >= bounds[0][0] and x['lat'] <= bounds[1][0] and x['lon'] >= bounds[0][1] and x['lon'] <= bounds[1][1]: 
-					uu1.append(x['value'])
-					latuu.append(x['lat'])
-					lonuu.append(x['lon'])
+		fi = numpy.where(valid, fi, 0.)
+		fj = numpy.where(valid, fj, 0.)
+		i = numpy.minimum(fi.astype(int), max(0, nlat - 2))
+		j = fj.astype(int)
+		if not self.wrap:
+			j = numpy.minimum(j, max(0, nlon - 2))
 
-			for x in v:
-				if x['lat'] >= bounds[0][0] and x['lat'] <= bounds[1][0] and x['lon'] >= bounds[0][1] and x['lon'] <= bounds[1][1]: 
-					vv1.append(x['value'])
-					latvv.append(x['lat'])
-					lonvv.append(x['lon'])
+		return (i, j, i + 1, (j + 1) % nlon, fi - i, fj - j, valid)
 
-
-			self.cache [h] = (uu1, vv1, latuu, lonuu)
-			return self.cache [h]
+	# Vectorized bilinear interpolation of the 2D array a on cells returned by locateBatch
+	@staticmethod
+	def interpolateBatch(a, cells):
+		i, j, i2, j2, fi, fj = cells[0:6]
+		return (a[i, j] * (1 - fi) + a[i2, j] * fi) * (1 - fj) + (a[i, j2] * (1 - fi) + a[i2, j2] * fi) * fj
+
+	# Grid with one point every factor x factor block, placed at the block centre
+	def decimate(self, factor):
+		nlat, nlon = self.shape[0] // factor, self.shape[1] // factor
+		lats = self.lats[:nlat * factor].reshape(nlat, factor).mean(axis=1)
+		lons = self.lons[:nlon * factor].reshape(nlon, factor).mean(axis=1)
+		return GribGrid(lats, lons)
+
+	# Average the decoded 2D array a on factor x factor blocks
+	@staticmethod
+	def downsample(a, factor):
+		nlat, nlon = a.shape[0] // factor, a.shape[1] // factor
+		a = a[:nlat * factor, :nlon * factor]
+		return a.reshape(nlat, factor, nlon, factor).mean(axis=(1, 3), dtype=numpy.float32)
+
+	# Return the lat slice and lon index of the points inside bounds. The lon index
+	# is a slice, or an index array stitching the two sides when bounds cross the
+	# end of a global grid
+	def slice(self, bounds):
+		la = numpy.searchsorted(self.lats, bounds[0][0], 'left')
+		lb = numpy.searchsorted(self.lats, bounds[1][0], 'right')
+		nlon = self.shape[1]
+
+		lon1, lon2 = boundsLons(bounds)
+		if lon2 - lon1 >= 360. or nlon < 2:
+			return slice(la, lb), slice(0, nlon)
+
+		# Box sides in (fractional) lon index, the west one taken before the grid
+		# origin when the box starts west of it
+		fa = ((lon1 - self.lon0) % 360.) / self.dlon
+		if not self.wrap and fa > nlon - 1:
+			fa -= 360. / self.dlon
+		fb = fa + (lon2 - lon1) / self.dlon
+
+		oa = max(0, int(math.ceil(fa - 1e-9)))
+		ob = int(math.floor(fb + 1e-9)) + 1
+
+		if ob <= nlon or not self.wrap:
+			return slice(la, lb), slice(oa, max(oa, min(ob, nlon)))
+		return slice(la, lb), numpy.r_[oa:nlon, 0:min(ob - nlon, oa)]
+
+	# Lon axis values of a lon index returned by slice, increasing across the stitch
+	def sliceLons(self, slon):
+		lons = self.lons[slon]
+		if isinstance(slon, slice):
+			return lons
+		return lons + numpy.where(slon < slon[0], 360., 0.)
 
 
-	def getWind (self, tt, bounds):
-		t = self._transformTime(tt)
+class Grib(weatherrouting.Grib):
+	def __init__ (self, path, name, centre, bounds, rindex, startTime, lastForecast, timeKey, grid, cache=None):
+		self.name = name
+		self.centre = centre.upper()
+		self.id = dataCache.newId()
+		self.rindex = rindex
+		self.steps = sorted(rindex.keys())
+		self.bounds = bounds
+		self.startTime = startTime
+		self.lastForecast = lastForecast
+		self.path = path
+		self.timeKey = timeKey
+		self.grid = grid
+		self.resolution = grid.getResolution() if grid else None
+		self.cache = cache
 
-		if t is None:
-			return
+		# First forecast step present (cropped or step-trimmed gribs may not start at 0)
+		self.firstForecast = self.steps[0] if self.steps else 0
 
-		t1 = int (int (round (t)) / 3) * 3
-		t2 = int (int (round (t+6)) / 3) * 3
+		# Decimated grids of the wind pyramid, levels[0] is the grib grid
+		self.levels = [grid] if grid else []
+		for i in range(1, PYRAMID_LEVELS + 1):
+			if not grid or min(grid.shape) // 2**i < 2:
+				break
+			self.levels.append(grid.decimate(2**i))
 
-		if t2 == t1:
-			t1 -= 3
 
-		lon1 = min (bounds[0][1], bounds[1][1])
-		lon2 = max (bounds[0][1], bounds[1][1])
+	# Return decoded (u, v, twd, tws) 2D arrays for the forecast step t
+	def getRIndexData(self, t):
+		data = dataCache.steps.get((self.id, t))
+		if data is not None:
+			return data
+
+		si = self.steps.index(t)
+		if self.cache and self.cache.has(si):
+			data = self.cache.get(si)
+			dataCache.steps[(self.id, t)] = data
+			return data
+
+		u = self.grid.decode(filePool.readValues(self.path, *self.rindex[t]['u']))
+		v = self.grid.decode(filePool.readValues(self.path, *self.rindex[t]['v']))
+		data = stepWind(u, v)
+
+		if self.cache and not self.cache.readonly:
+			self.cache.put(si, *data)
+			data = self.cache.get(si)
+
+		dataCache.steps[(self.id, t)] = data
+		self._buildPyramid(t, data[0], data[1])
+		return data
+
+	def _buildPyramid(self, t, u, v):
+		for i in range(1, len(self.levels)):
+			u = GribGrid.downsample(u, 2)
+			v = GribGrid.downsample(v, 2)
+			dataCache.levels[(self.id, t, i)] = stepWind(u, v)
+
+	# Return (u, v, twd, tws) 2D arrays of the pyramid level for the forecast step t
+	def getLevelData(self, t, level):
+		if level == 0:
+			return self.getRIndexData(t)
+
+		data = dataCache.levels.get((self.id, t, level))
+		if data is None:
+			u, v, _, _ = self.getRIndexData(t)
+			self._buildPyramid(t, u, v)
+			data = dataCache.levels.get((self.id, t, level))
+		return data
+
+
+	# Get the (u, v, twd, tws, lats, lons) grid slices inside bounds for forecast step t
+	def _getWindDataCached (self, t, bounds, level=0):
+		grid = self.levels[level]
+		slat, slon = grid.slice (bounds)
+		data = tuple(a[slat, slon] for a in self.getLevelData (t, level))
+		return data + (grid.lats[slat], grid.sliceLons(slon))
+
+
+	# Return the steps (t1, t2) around t and the interpolation factor between them
+	def _timeBracket(self, t):
+		i = bisect.bisect_right(self.steps, t)
+		if i == 0:
+			return self.steps[0], self.steps[0], 0.
+		if i >= len(self.steps):
+			return self.steps[-1], self.steps[-1], 0.
+
+		t1 = self.steps[i - 1]
+		t2 = self.steps[i]
+		return t1, t2, (t - t1) * 1.0 / (t2 - t1)
+
+
+	# Return the interpolated (twd, tws, lats, lons) grid arrays inside bounds at time tt,
+	# taken from the given pyramid level (clamped to the available ones); results are
+	# cached per (time, bounds, level) so redraws and prefetched frames are reused
+	def getWindGrid (self, tt, bounds, level=0):
+		t = self._transformTime(tt)
 
-		otherside = None
+		if t is None:
+			return None
 
-		# if lon1 < 0.0 and lon2 < 0.0:
-		# 	lon1 = 180. + abs (lon1)
-		# 	lon2 = 180. + abs (lon2)
-		# elif lon1 < 0.0:
-		# 	otherside = (-180.0, lon1)
-		# elif lon2 < 0.0:
-		# 	otherside = (-180.0, lon2)
+		level = max(0, min(level, len(self.levels) - 1))
 
-		bounds = [(bounds[0][0], min (lon1, lon2)), (bounds[1][0], max (lon1, lon2))]
-		(uu1, vv1, latuu, lonuu) = self._getWindDataCached (t1, bounds)
-		(uu2, vv2, latuu2, lonuu2) = self._getWindDataCached (t2, bounds)
+		# Boxes crossing the antimeridian are served by the grid slice in one query
+		lon1, lon2 = boundsLons (bounds)
+		key = (self.id, t, bounds[0][0], lon1, bounds[1][0], lon2, level)
+		data = dataCache.grids.get(key)
+		if data is not None:
+			return data
 
-		if otherside:
-			bounds = [(bounds[0][0], min (otherside[0], otherside[1])), (bounds[1][0], max (otherside[0], otherside[1]))]
-			dataotherside = self.getWind (t, bounds)
-		else:
-			dataotherside = []
+		t1, t2, f = self._timeBracket(t)
 
-		data = []
+		bounds = [(bounds[0][0], lon1), (bounds[1][0], lon2)]
+		(uu1, vv1, twd, tws, lats, lons) = self._getWindDataCached (t1, bounds, level)
 
-		for j in range (0, len (uu1)):
-			lon = lonuu[j]
-			lat = latuu[j]
+		# Between two steps blend U/V in bulk, on a step use the precomputed arrays
+		if f > 0:
+			(uu2, vv2, _, _, _, _) = self._getWindDataCached (t2, bounds, level)
+			twd, tws = uvToWind(uu1 + (uu2 - uu1) * f, vv1 + (vv2 - vv1) * f)
 
-			if lon > 180.0:
-				lon = -180. + (lon - 180.)
+		data = (twd, tws, lats, lons)
+		dataCache.grids[key] = data
+		return data
 
-			#if utils.pointInCountry (lat, lon):
-			#	continue
 
-			uu = uu1[j] + (uu2[j] - uu1[j]) * (t - t1) * 1.0 / (t2 - t1)
-			vv = vv1[j] + (vv2[j] - vv1[j]) * (t - t1) * 1.0 / (t2 - t1)
+	def getWind (self, tt, bounds, level=0):
+		data = self.getWindGrid(tt, bounds, level)
 
-			tws = (uu**2+vv**2)/2.
-			twd = math.degrees(utils.reduce360(math.atan2(uu,vv)+math.pi))
+		if data is None:
+			return None
 
-			data.append ((twd, tws, (lat, lon)))
+		#if utils.pointInCountry (lat, lon):
+		#	continue
 
-		return data + dataotherside
+		twd, tws, lats, lons = data
+		lat2d, lon2d = numpy.meshgrid(lats, lons, indexing='ij')
+		latlons = zip(lat2d.ravel().tolist(), lon2d.ravel().tolist())
+		return list(zip(twd.ravel().tolist(), tws.ravel().tolist(), latlons))
 
 
 	def _transformTime(self, t):
 		if (self.startTime + datetime.timedelta(hours=self.lastForecast)) < t:
 			return None
 
-		if t > self.startTime + datetime.timedelta(hours=self.lastForecast):
+		if t < self.startTime:
 			return None
 
-		return math.floor((t - self.startTime).total_seconds() / 60 / 60)
+		return (t - self.startTime).total_seconds() / 60 / 60
 
-	# Get wind direction and speed in a point, used by simulator
+	# Get wind direction and speed in a point, used by simulator; bilinear in space
+	# and linear in time, None if the point is outside the grib scope
 	def getWindAt (self, t, lat, lon):
-		bounds = [
-			(math.floor (lat * 2) / 2., math.floor (lon * 2) / 2.), 
-			(math.ceil (lat * 2) / 2., math.ceil (lon * 2) / 2.)
-		]
-		data = self.getWind (t, bounds)
+		t = self._transformTime(t)
+		if t is None:
+			return None
 
-		wind = (data[0][0], data[0][1])
-		return wind
+		cell = self.grid.locate(lat, lon)
+		if cell is None:
+			return None
+
+		t1, t2, f = self._timeBracket(t)
+		u1, v1, _, _ = self.getRIndexData(t1)
+		u2, v2, _, _ = self.getRIndexData(t2)
+
+		uu1 = GribGrid.interpolate(u1, cell)
+		vv1 = GribGrid.interpolate(v1, cell)
+		uu = uu1 + (GribGrid.interpolate(u2, cell) - uu1) * f
+		vv = vv1 + (GribGrid.interpolate(v2, cell) - vv1) * f
+
+		twd, tws = uvToWind(uu, vv)
+		return (float(twd), float(tws))
+
+	# Vectorized getWindAt: t is a datetime or a sequence of datetimes (one per point);
+	# returns (twd, tws) arrays, NaN where the point is outside the grib scope
+	def getWindAtBatch (self, t, lats, lons):
+		lats = numpy.asarray(lats, dtype=float)
+		lons = numpy.asarray(lons, dtype=float)
+		hours = self._transformTimes(t, lats.shape)
+
+		cells = self.grid.locateBatch(lats, lons)
+		valid = cells[6] & ~numpy.isnan(hours)
+		hours = numpy.where(valid, hours, self.steps[0])
+
+		steps = numpy.asarray(self.steps, dtype=float)
+		k = numpy.searchsorted(steps, hours, 'right')
+		k1 = numpy.clip(k - 1, 0, len(steps) - 1)
+		k2 = numpy.clip(k, 0, len(steps) - 1)
+		span = steps[k2] - steps[k1]
+		f = numpy.where(span > 0, (hours - steps[k1]) / numpy.where(span > 0, span, 1.), 0.)
+
+		uu = numpy.zeros(lats.shape)
+		vv = numpy.zeros(lats.shape)
+
+		for s in numpy.unique(numpy.concatenate((k1[valid], k2[valid]))):
+			w = numpy.where(k1 == s, 1. - f, 0.) + numpy.where(k2 == s, f, 0.)
+			m = valid & (w > 0)
+			if not m.any():
+				continue
+
+			u, v, _, _ = self.getRIndexData(self.steps[s])
+			mcells = [c[m] for c in cells[0:6]]
+			uu[m] += w[m] * GribGrid.interpolateBatch(u, mcells)
+			vv[m] += w[m] * GribGrid.interpolateBatch(v, mcells)
+
+		twd, tws = uvToWind(uu, vv)
+		twd[~valid] = numpy.nan
+		tws[~valid] = numpy.nan
+		return twd, tws
+
+	# Vectorized _transformTime: forecast hours array, NaN for times out of scope
+	def _transformTimes(self, t, shape):
+		if isinstance(t, datetime.datetime):
+			h = self._transformTime(t)
+			return numpy.full(shape, numpy.nan if h is None else h)
+
+		h = numpy.array([(x - self.startTime).total_seconds() / 60 / 60 for x in t], dtype=float)
+		h[(h < 0) | (h > self.lastForecast)] = numpy.nan
+		return h.reshape(shape)
 
 	@staticmethod
 	def parseMetadata(path):
 		import eccodes
 		f = open(path, 'rb')
 
-		# TODO: get bounds and timeframe
 		bounds = [0, 0, 0, 0]
+		resolution = None
+		firstForecast = None
 		hoursForecasted = None
 		startTime = None
 		centre = ''
+		messages = 0
 
 		while True:
-			msgid = eccodes.codes_grib_new_from_file(f)
+			msgid = eccodes.codes_grib_new_from_file(f, headers_only=True)
 
 			if msgid is None:
 				break
 
+			messages += 1
+
 			name = eccodes.codes_get(msgid, 'name')
-			if name != '10 metre U wind component' and name != '10 metre V wind component':
+			if name not in (WIND_U, WIND_V):
+				eccodes.codes_release(msgid)
 				continue
 
+			if resolution is None:
+				grid = GribGrid.fromMessage(msgid)
+				bounds = grid.getBounds()
+				resolution = grid.getResolution()
+
 			vcentre = eccodes.codes_get(msgid, 'centre')
 			if vcentre:
 				centre = vcentre
@@ -216,35 +648,74 @@ class Grib(weatherrouting.Grib):
 
 			if hoursForecasted is None or hoursForecasted < int(ft):
 				hoursForecasted = int(ft)
+			if firstForecast is None or firstForecast > int(ft):
+				firstForecast = int(ft)
 
 			eccodes.codes_release(msgid)
 
 		f.close()
-		return MetaGrib(path, path.split('/')[-1], centre, bounds, startTime, hoursForecasted)
+		if resolution is None:
+			raise ValueError(f'Grib {path} has no wind messages')
+
+		return MetaGrib(path, path.split('/')[-1], centre, bounds, startTime, hoursForecasted, messages, resolution,
+			firstForecast or 0)
+
+	# Metadata stored in the decoded cache sidecar
+	def toMeta(self):
+		return {
+			'centre': self.centre,
+			'bounds': self.bounds,
+			'rindex': self.rindex,
+			'startTime': self.startTime.isoformat(),
+			'lastForecast': self.lastForecast,
+			'timeKey': self.timeKey,
+			'grid': self.grid.toDict()
+		}
+
+	@staticmethod
+	def fromCache(path, cache):
+		m = cache.meta
+		rindex = { int(k): v for k, v in m['rindex'].items() }
+		return Grib(path, path.split('/')[-1], m['centre'], m['bounds'], rindex,
+			datetime.datetime.fromisoformat(m['startTime']), m['lastForecast'], m['timeKey'],
+			GribGrid.fromDict(m['grid']), cache)
 
 	@staticmethod
-	def parse (path):
+	def parse (path, readonly=False):
 		import eccodes
+
+		cache = GribCache(path)
+		if cache.load(readonly):
+			logger.debug('Loaded grib %s from decoded cache', path)
+			return Grib.fromCache(path, cache)
+
 		f = open(path, 'rb')
 
-		# TODO: get bounds and timeframe
 		bounds = [0, 0, 0, 0]
 		hoursForecasted = None
 		startTime = None
-		rindex = {}			
+		rindex = {}
 		centre = ''
 		timeKey = "P1"
+		grid = None
 
+		# Only headers are read here: the (offset, length) of every wind message is
+		# recorded in rindex and its data is read later, on first touch
 		while True:
-			msgid = eccodes.codes_grib_new_from_file(f)
+			msgid = eccodes.codes_grib_new_from_file(f, headers_only=True)
 
 			if msgid is None:
 				break
 
 			name = eccodes.codes_get(msgid, 'name')
-			if name != '10 metre U wind component' and name != '10 metre V wind component':
+			if name not in (WIND_U, WIND_V):
+				eccodes.codes_release(msgid)
 				continue
 
+			if grid is None:
+				grid = GribGrid.fromMessage(msgid)
+				bounds = grid.getBounds()
+
 			centre = eccodes.codes_get(msgid, 'centre')
 
 			try:
@@ -265,17 +736,69 @@ class Grib(weatherrouting.Grib):
 				hoursForecasted = int(ft)
 
 			# timeIndex = str(r['dataDate'])+str(r['dataTime'])
-			if name == '10 metre U wind component':
-				rindex [hoursForecasted] = { 'u': msgid }
-			elif name == '10 metre V wind component':
-				rindex [hoursForecasted]['v'] = msgid
+			loc = [int(eccodes.codes_get(msgid, 'offset')), int(eccodes.codes_get(msgid, 'totalLength'))]
+			if name == WIND_U:
+				rindex.setdefault(int(ft), {})['u'] = loc
+			elif name == WIND_V:
+				rindex.setdefault(int(ft), {})['v'] = loc
 
 			eccodes.codes_release(msgid)
 
-		index_keys = ["name", timeKey]
-		iid = eccodes.codes_index_new_from_file(path, index_keys)
-		eccodes.codes_index_write(iid, path + '.idx')
-		eccodes.codes_index_release(iid)
 		f.close()
+		filePool.release(path)
 
-		return Grib(path, path.split('/')[-1], centre, bounds, rindex, startTime, hoursForecasted, timeKey)
+		if grid is None:
+			raise ValueError(f'Grib {path} has no wind messages')
+
+		grib = Grib(path, path.split('/')[-1], centre, bounds, rindex, startTime, hoursForecasted, timeKey, grid)
+		if cache.create(grib.toMeta(), (len(grib.steps), 4) + grid.shape):
+			grib.cache = cache
+		return grib
+
+
+class LazyGrib(weatherrouting.Grib):
+	""" Lightweight handle of a grib file, parsed on its first wind query.
+
+	Until then, metadata attributes (bounds, startTime, ...) are served from the
+	optional MetaGrib, so the handle can be registered without touching eccodes.
+	"""
+
+	def __init__(self, path, meta=None, readonly=False):
+		self.path = path
+		self.name = path.split('/')[-1]
+		self.meta = meta
+		self.readonly = readonly
+		self.grib = None
+		self.lock = threading.Lock()
+
+	def isLoaded(self):
+		return self.grib is not None
+
+	def load(self):
+		if self.grib is not None:
+			return self.grib
+
+		with self.lock:
+			if self.grib is None:
+				logger.info("Loading grib %s", self.path)
+				self.grib = Grib.parse(self.path, self.readonly)
+		return self.grib
+
+	def __getattr__(self, attr):
+		if attr in ('grib', 'meta', 'readonly'):
+			raise AttributeError(attr)
+		if self.grib is None and self.meta is not None and hasattr(self.meta, attr):
+			return getattr(self.meta, attr)
+		return getattr(self.load(), attr)
+
+	def getWind(self, t, bounds, level=0):
+		return self.load().getWind(t, bounds, level)
+
+	def getWindGrid(self, t, bounds, level=0):
+		return self.load().getWindGrid(t, bounds, level)
+
+	def getWindAt(self, t, lat, lon):
+		return self.load().getWindAt(t, lat, lon)
+
+	def getWindAtBatch(self, t, lats, lons):
+		return self.load().getWindAtBatch(t, lats, lons)
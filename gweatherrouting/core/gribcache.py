@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import os
+import json
+import hashlib
+import logging
+import threading
+import numpy
+
+logger = logging.getLogger ('gweatherrouting')
+
+CACHE_VERSION = 4
+HASH_CHUNK = 1024 * 1024
+
+
+# Identify a file by size, mtime and a hash of its first and last chunk
+def fileKey(path):
+	st = os.stat(path)
+	h = hashlib.sha1()
+
+	with open(path, 'rb') as f:
+		h.update(f.read(HASH_CHUNK))
+		if st.st_size > HASH_CHUNK:
+			f.seek(max(HASH_CHUNK, st.st_size - HASH_CHUNK))
+			h.update(f.read(HASH_CHUNK))
+
+	return { 'size': st.st_size, 'mtime': st.st_mtime, 'hash': h.hexdigest() }
+
+
+class GribCache:
+	""" Sidecar cache of the decoded wind arrays of a grib file.
+
+	The arrays live in `<grib>.wind.npy` with shape (steps, 4, lat, lon), holding
+	U, V and the precomputed TWD / TWS of every step, and are memory mapped, so only
+	the pages actually read are loaded; `<grib>.wind.json` holds grid / time
+	metadata and the list of steps already decoded. Steps are
+	decoded lazily by the Grib on first touch and stored here for the next sessions.
+
+	A cache loaded read only maps the data file without write access: processes
+	sharing a fully decoded cache share its pages and never write it.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.dataPath = path + '.wind.npy'
+		self.metaPath = path + '.wind.json'
+		self.meta = None
+		self.data = None
+		self.readonly = False
+		self.lock = threading.Lock()
+
+	@staticmethod
+	def files(path):
+		return [path + '.wind.npy', path + '.wind.json']
+
+	# Open an existing cache; return False if missing or stale
+	def load(self, readonly=False):
+		try:
+			with open(self.metaPath, 'r') as f:
+				meta = json.loads(f.read())
+
+			if meta.get('version') != CACHE_VERSION or meta['key'] != fileKey(self.path):
+				return False
+
+			self.data = numpy.load(self.dataPath, mmap_mode='r' if readonly else 'r+')
+			self.meta = meta
+			self.readonly = readonly
+			return True
+		except Exception as e:
+			if os.path.exists(self.metaPath):
+				logger.debug('Discarding grib cache %s: %s', self.metaPath, str(e))
+			return False
+
+	# Allocate a new (empty) cache for the given metadata and array shape
+	def create(self, meta, shape):
+		try:
+			self.meta = dict(meta)
+			self.meta['version'] = CACHE_VERSION
+			self.meta['key'] = fileKey(self.path)
+			self.meta['decoded'] = [False] * shape[0]
+			self.data = numpy.lib.format.open_memmap(self.dataPath, mode='w+', dtype=numpy.float32, shape=shape)
+			self._saveMeta()
+			return True
+		except Exception as e:
+			logger.warning('Unable to create grib cache for %s: %s', self.path, str(e))
+			self.meta = None
+			self.data = None
+			return False
+
+	def isValid(self):
+		return self.data is not None
+
+	def has(self, i):
+		return self.meta is not None and self.meta['decoded'][i]
+
+	# Return (u, v, twd, tws) memory mapped views of step i
+	def get(self, i):
+		return tuple(self.data[i, k] for k in range(self.data.shape[1]))
+
+	def put(self, i, *arrays):
+		with self.lock:
+			for k, a in enumerate(arrays):
+				self.data[i, k] = a
+			self.data.flush()
+			self.meta['decoded'][i] = True
+			self._saveMeta()
+
+	# Mark step i as decoded, once written in the data file by someone else
+	def setDecoded(self, i):
+		with self.lock:
+			self.meta['decoded'][i] = True
+			self._saveMeta()
+
+	def _saveMeta(self):
+		tmp = self.metaPath + '.tmp'
+		with open(tmp, 'w') as f:
+			f.write(json.dumps(self.meta))
+		os.replace(tmp, self.metaPath)
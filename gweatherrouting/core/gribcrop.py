@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import logging
+import argparse
+import numpy
+
+from .grib import WIND_U, WIND_V
+
+logger = logging.getLogger ('gweatherrouting')
+
+
+# Name of the cropped copy of a grib file
+def croppedName(path):
+	name, ext = os.path.splitext(path.split('/')[-1])
+	return name + '_crop' + ext
+
+
+# Crop the regular lat/lon message gid in place to the bounds box
+# ((lat1, lon1), (lat2, lon2)), keeping one point every thin along both axes;
+# the box may cross the antimeridian (lon1 > lon2)
+def cropMessage(gid, bounds=None, thin=1):
+	import eccodes
+
+	nj = eccodes.codes_get(gid, 'Nj')
+	ni = eccodes.codes_get(gid, 'Ni')
+	lats = eccodes.codes_get_array(gid, 'latitudes').reshape(nj, ni)[:, 0]
+	lons = eccodes.codes_get_array(gid, 'longitudes').reshape(nj, ni)[0, :]
+	values = eccodes.codes_get_values(gid).reshape(nj, ni)
+
+	rows = numpy.arange(nj)
+	cols = numpy.arange(ni)
+
+	if bounds:
+		lat1, lat2 = min(bounds[0][0], bounds[1][0]), max(bounds[0][0], bounds[1][0])
+		rows = numpy.nonzero((lats >= lat1) & (lats <= lat2))[0]
+
+		# Columns ordered by their eastward distance from the west side of the box
+		width = bounds[1][1] - bounds[0][1]
+		width = 360. if width >= 360. else width % 360.
+		d = numpy.mod(lons - bounds[0][1], 360.)
+		cols = numpy.nonzero(d <= width)[0]
+		cols = cols[numpy.argsort(d[cols], kind='stable')]
+
+	rows = rows[::thin]
+	cols = cols[::thin]
+	if len(rows) < 2 or len(cols) < 2:
+		raise ValueError('The crop box is smaller than the grid resolution')
+
+	dlat = abs(lats[rows[1]] - lats[rows[0]])
+	dlon = (lons[cols[1]] - lons[cols[0]]) % 360.
+	lon1 = lons[cols[0]] % 360.
+	lon2 = (lon1 + dlon * (len(cols) - 1)) % 360.
+
+	eccodes.codes_set(gid, 'Ni', len(cols))
+	eccodes.codes_set(gid, 'Nj', len(rows))
+	eccodes.codes_set(gid, 'latitudeOfFirstGridPointInDegrees', float(lats[rows[0]]))
+	eccodes.codes_set(gid, 'latitudeOfLastGridPointInDegrees', float(lats[rows[-1]]))
+	eccodes.codes_set(gid, 'longitudeOfFirstGridPointInDegrees', float(lon1))
+	eccodes.codes_set(gid, 'longitudeOfLastGridPointInDegrees', float(lon2))
+	eccodes.codes_set(gid, 'iDirectionIncrementInDegrees', float(dlon))
+	eccodes.codes_set(gid, 'jDirectionIncrementInDegrees', float(dlat))
+	eccodes.codes_set_values(gid, values[numpy.ix_(rows, cols)].ravel())
+
+
+# Write in dest a compact copy of the grib src holding only its wind messages,
+# cropped to bounds, to the forecast hours window (h1, h2) and thinned by thin;
+# return the number of messages written
+def cropGrib(src, dest, bounds=None, hours=None, thin=1):
+	import eccodes
+
+	part = dest + '.part'
+	written = 0
+
+	# Messages are scanned on f (headers only) and read from data, eccodes keeps its
+	# own position on the scanned file
+	with open(src, 'rb') as f, open(src, 'rb') as data, open(part, 'wb') as out:
+		while True:
+			hid = eccodes.codes_grib_new_from_file(f, headers_only=True)
+			if hid is None:
+				break
+
+			try:
+				name = eccodes.codes_get(hid, 'name')
+				if name not in (WIND_U, WIND_V):
+					continue
+
+				try:
+					ft = eccodes.codes_get(hid, 'forecastTime')
+				except:
+					ft = eccodes.codes_get(hid, 'P1')
+
+				if hours and (ft < hours[0] or ft > hours[1]):
+					continue
+
+				offset = int(eccodes.codes_get(hid, 'offset'))
+				length = int(eccodes.codes_get(hid, 'totalLength'))
+			finally:
+				eccodes.codes_release(hid)
+
+			data.seek(offset)
+			gid = eccodes.codes_new_from_message(data.read(length))
+
+			try:
+				cropMessage(gid, bounds, thin)
+				eccodes.codes_write(gid, out)
+				written += 1
+			finally:
+				eccodes.codes_release(gid)
+
+	if written == 0:
+		os.remove(part)
+		raise ValueError('No wind messages inside the crop window')
+
+	os.replace(part, dest)
+	logger.info('Cropped %s to %s (%d messages)', src, dest, written)
+	return written
+
+
+def main():
+	from .utils.storage import GRIB_DIR
+
+	parser = argparse.ArgumentParser(description='Crop a grib file to a routing area, keeping only wind')
+	parser.add_argument('grib', help='source grib file')
+	parser.add_argument('-b', '--bounds', nargs=4, type=float, metavar=('LAT1', 'LON1', 'LAT2', 'LON2'),
+		help='box corners (LON1 > LON2 crosses the antimeridian)')
+	parser.add_argument('-t', '--hours', nargs=2, type=int, metavar=('FROM', 'TO'),
+		help='forecast hours window')
+	parser.add_argument('-n', '--thin', type=int, default=1, help='keep one grid point every THIN')
+	parser.add_argument('-o', '--output', help=f'output file (default: {GRIB_DIR}/<name>_crop.<ext>)')
+	args = parser.parse_args()
+
+	bounds = ((args.bounds[0], args.bounds[1]), (args.bounds[2], args.bounds[3])) if args.bounds else None
+	dest = args.output or GRIB_DIR + '/' + croppedName(args.grib)
+
+	try:
+		n = cropGrib(args.grib, dest, bounds, args.hours, args.thin)
+	except Exception as e:
+		print(f'Unable to crop {args.grib}: {e}', file=sys.stderr)
+		sys.exit(1)
+
+	print(f'{dest}: {n} messages, {os.path.getsize(dest)} bytes (from {os.path.getsize(args.grib)})')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy
+
+from .grib import filePool, stepWind
+
+logger = logging.getLogger ('gweatherrouting')
+
+
+# Worker: decode the U/V messages of step si and write the step wind arrays
+# straight into the shared .wind.npy memmap
+def decodeStep(path, dataPath, si, loc, grid):
+	u = grid.decode(filePool.readValues(path, *loc['u']))
+	v = grid.decode(filePool.readValues(path, *loc['v']))
+
+	data = numpy.load(dataPath, mmap_mode='r+')
+	for k, a in enumerate(stepWind(u, v)):
+		data[si, k] = a
+	data.flush()
+	return si
+
+
+class GribDecoder:
+	""" Optional process pool decoding all the forecast steps of a grib at once.
+
+	Steps are fanned out across the workers, which write the decoded arrays in the
+	memory mapped grib cache, so nothing but the step number travels back to this
+	process. Without a cache the steps are decoded serially.
+	"""
+
+	def __init__(self, workers=None):
+		self.workers = workers or os.cpu_count() or 1
+
+	def decode(self, grib):
+		todo = [si for si in range(len(grib.steps)) if not (grib.cache and grib.cache.has(si))]
+		if len(todo) == 0:
+			return
+
+		t0 = time.time()
+
+		if not grib.cache or self.workers < 2 or len(todo) < 2:
+			for si in todo:
+				grib.getRIndexData(grib.steps[si])
+			return
+
+		# Workers are spawned: forking a process with the ui / prefetch threads running is unsafe
+		ctx = multiprocessing.get_context('spawn')
+		with ProcessPoolExecutor(max_workers=min(self.workers, len(todo)), mp_context=ctx) as executor:
+			futures = [executor.submit(decodeStep, grib.path, grib.cache.dataPath, si,
+				grib.rindex[grib.steps[si]], grib.grid) for si in todo]
+
+			for f in as_completed(futures):
+				try:
+					grib.cache.setDecoded(f.result())
+				except Exception as e:
+					logger.error('Unable to decode a step of %s: %s', grib.name, str(e))
+
+		logger.info('Decoded %d steps of %s with %d workers in %.2fs', len(todo), grib.name,
+			min(self.workers, len(todo)), time.time() - t0)
@@ -1,11 +1,18 @@
 from shutil import copyfile
 import os
 import logging
+import datetime
+from threading import Thread
+import numpy
 import requests
 import weatherrouting
-from .grib import Grib
+from .grib import Grib, MetaGrib, LazyGrib, filePool, dataCache, boundsLons
+from .gribcache import GribCache
+from .gribdecoder import GribDecoder
+from .gribcrop import cropGrib, croppedName
+from .downloadmanager import DownloadManager, adaptiveChunks
 # try:
-from .utils.storage import Storage, GRIB_DIR, TEMP_DIR
+from .utils.storage import Storage, GRIB_DIR
 # except:
 # from .utils.dummy_storage import Storage
 
@@ -19,29 +26,143 @@ class GribManagerStorage(Storage):
 		self.opened = []
 		self.loadOrSaveDefault()
 
-class GribManager(weatherrouting.Grib):
+# Metadata of the local gribs, keyed by file name and invalidated by size / mtime
+class GribMetadataStorage(Storage):
 	def __init__(self):
-		self.storage = GribManagerStorage()
+		Storage.__init__(self, "grib-metadata")
+		self.gribs = {}
+		self.loadOrSaveDefault()
+
+class GribCoverage:
+	""" Spatial and temporal extent of a grib, used to select the grib serving a query """
+
+	def __init__(self, grib):
+		self.grib = grib
+		self.latMin, self.lonMin, self.latMax, self.lonMax = grib.bounds
+		self.resolution = grib.resolution or float('inf')
+		# Coverage starts at the first forecast step actually present in the grib
+		self.run = grib.startTime
+		self.start = grib.startTime + datetime.timedelta(hours=grib.firstForecast)
+		self.end = grib.startTime + datetime.timedelta(hours=grib.lastForecast)
+		self.wrap = self.lonMax - self.lonMin + self.resolution >= 360. - 1e-6
+
+	# Selection priority: highest resolution first, then freshest run
+	def priority(self):
+		return (self.resolution, -self.run.timestamp())
+
+	def coversTime(self, t):
+		return self.start <= t <= self.end
+
+	# Longitudes are compared east of lonMin, so grids going past 180 and boxes
+	# crossing the antimeridian are handled too
+	def contains(self, lat, lon):
+		if lat < self.latMin or lat > self.latMax:
+			return False
+		if self.wrap:
+			return True
+		return (lon - self.lonMin) % 360. <= self.lonMax - self.lonMin
+
+	def containsBatch(self, lats, lons):
+		m = (lats >= self.latMin) & (lats <= self.latMax)
+		if self.wrap:
+			return m
+		return m & (numpy.mod(lons - self.lonMin, 360.) <= self.lonMax - self.lonMin)
+
+	# Return 2 if bounds are fully inside, 1 if they intersect, 0 otherwise
+	def overlaps(self, bounds):
+		lat1, lat2 = min(bounds[0][0], bounds[1][0]), max(bounds[0][0], bounds[1][0])
+		lon1, lon2 = boundsLons(bounds)
+
+		if lat2 < self.latMin or lat1 > self.latMax:
+			return 0
+
+		latInside = lat1 >= self.latMin and lat2 <= self.latMax
+		if self.wrap:
+			return 2 if latInside else 1
+
+		west = (lon1 - self.lonMin) % 360.
+		east = west + lon2 - lon1
+		width = self.lonMax - self.lonMin
+		if west > width and east < 360.:
+			return 0
+		if latInside and east <= width:
+			return 2
+		return 1
+
+	# True if the whole coverage lies inside bounds
+	def within(self, bounds):
+		lat1, lat2 = min(bounds[0][0], bounds[1][0]), max(bounds[0][0], bounds[1][0])
+		lon1, lon2 = boundsLons(bounds)
+
+		if self.latMin < lat1 or self.latMax > lat2:
+			return False
+
+		width = 360. if self.wrap else self.lonMax - self.lonMin
+		return (self.lonMin - lon1) % 360. + width <= lon2 - lon1
+
+
+class GribManager(weatherrouting.Grib):
+	# With decodeWorkers > 0 loaded gribs are fully decoded upfront by a process pool
+	# of that size, instead of step by step on first touch. A bare manager has no
+	# storage, local gribs index nor download queue and only serves the gribs loaded
+	# explicitly (ie: in routing workers, which must not touch the user data)
+	def __init__(self, warmup=False, decodeWorkers=0, bare=False):
+		self.storage = None if bare else GribManagerStorage()
+		self.metadataStorage = None if bare else GribMetadataStorage()
 		self.gribFiles = None
+		self.downloadManager = None if bare else DownloadManager(self)
+		self.decoder = GribDecoder(decodeWorkers) if decodeWorkers > 0 else None
 
 		self.gribs = []
 		self.timeframe = [0, 0]
+		self.coverage = []
+		self.coverageOf = []
 
 		self.localGribs = []
+		if bare:
+			return
+
 		self.refreshLocalGribs()
 
+		# Opened gribs are only registered here; they are decoded on first query
 		for x in self.storage.opened:
-			self.enable(x)
+			self.load(GRIB_DIR + "/" + x, lazy=True)
+
+		if warmup:
+			self.warmup()
 
 	def refreshLocalGribs(self):
 		self.localGribs = []
+		index = self.metadataStorage.gribs or {}
+		nindex = {}
+
 		for x in os.listdir(GRIB_DIR):
 			if x[-4:] == '.idx' or (x[-5:] != '.grib' and x[-4:] != '.grb'):
 				continue
 
-			m = Grib.parseMetadata(GRIB_DIR + "/" + x)
+			path = GRIB_DIR + "/" + x
+			st = os.stat(path)
+			e = index.get(x)
+
+			if e and e['size'] == st.st_size and e['mtime'] == st.st_mtime and 'resolution' in e:
+				m = MetaGrib.fromDict(path, e)
+			else:
+				logger.debug("Scanning grib metadata %s", path)
+				try:
+					m = Grib.parseMetadata(path)
+				except ValueError as ex:
+					logger.error("Unable to scan grib %s: %s", x, str(ex))
+					continue
+				e = m.toDict()
+				e['size'] = st.st_size
+				e['mtime'] = st.st_mtime
+
+			nindex[x] = e
 			self.localGribs.append(m)
 
+		if nindex != index:
+			self.metadataStorage.gribs = nindex
+
 	def storeOpenedGribs(self):
 		ss = []
 		for x in self.gribs:
@@ -51,9 +172,36 @@ class GribManager(weatherrouting.Grib):
 				ss.append(x.name)
 		self.storage.opened = ss
 
-	def load(self, path):
-		logger.info("Loading grib %s", path)
-		self.gribs.append(Grib.parse(path))
+	# A readonly grib maps its decoded cache without writing it (see GribCache)
+	def load(self, path, lazy=False, readonly=False):
+		name = path.split('/')[-1]
+		meta = None
+		for x in self.localGribs:
+			if x.name == name:
+				meta = x
+
+		g = LazyGrib(path, meta, readonly)
+		if not lazy:
+			self._decode(g)
+		self.gribs.append(g)
+
+	def _decode(self, g):
+		g.load()
+		if self.decoder:
+			self.decoder.decode(g.grib)
+
+	# Load all the registered gribs in a background thread
+	def warmup(self):
+		def loadAll():
+			for x in list(self.gribs):
+				try:
+					self._decode(x)
+				except Exception as e:
+					logger.error("Unable to load grib %s: %s", x.name, str(e))
+
+		t = Thread(target=loadAll, args=(), daemon=True)
+		t.start()
+		return t
 
 	def changeState(self, name, state):
 		if not state:
@@ -66,11 +214,18 @@ class GribManager(weatherrouting.Grib):
 		self.storeOpenedGribs()
 
 	def disable(self, name):
-		for x in self.gribs:
+		for x in list(self.gribs):
 			if x.name == name:
 				self.gribs.remove(x)
+				self._release(x)
 				self.storeOpenedGribs()
 
+	# Drop the decoded data of a grib kept in memory
+	def _release(self, g):
+		grib = g.grib if isinstance(g, LazyGrib) else g
+		if grib is not None:
+			dataCache.release(grib.id)
+
 	def isEnabled(self, name):
 		for x in self.gribs:
 			if x.name == name:
@@ -80,41 +235,109 @@ class GribManager(weatherrouting.Grib):
 	def hasGrib(self):
 		return len(self.gribs) > 0
 
+	# Coverage of the loaded gribs sorted by selection priority, rebuilt when gribs change
+	def getCoverage(self):
+		if self.coverageOf != self.gribs:
+			cov = []
+			for x in list(self.gribs):
+				try:
+					cov.append(GribCoverage(x))
+				except Exception as e:
+					logger.error("Unable to get coverage of grib %s: %s", x.name, str(e))
+
+			self.coverage = sorted(cov, key=lambda c: c.priority())
+			self.coverageOf = list(self.gribs)
+		return self.coverage
+
+	# Return the best grib covering bounds at time t (preferring gribs fully containing them)
+	def getBestGrib(self, t, bounds):
+		best = None
+		for c in self.getCoverage():
+			if not c.coversTime(t):
+				continue
+
+			o = c.overlaps(bounds)
+			if o == 2:
+				return c.grib
+			if o == 1 and best is None:
+				best = c.grib
+		return best
+
 	def getWindAt(self, t, lat, lon):
-		for x in self.gribs:
+		for c in self.getCoverage():
+			if not c.coversTime(t) or not c.contains(lat, lon):
+				continue
+
 			try:
-				return x.getWindAt(t, lat, lon)
-			except:
-				pass
+				w = c.grib.getWindAt(t, lat, lon)
+				if w is not None:
+					return w
+			except Exception as e:
+				logger.error("Grib %s getWindAt failed: %s", c.grib.name, str(e))
+
+	# Batch getWindAt over arrays of lats / lons (and optionally one time per point);
+	# each sub-batch goes to the best grib covering it, NaN where no grib has data
+	def getWindAtBatch(self, t, lats, lons):
+		lats = numpy.asarray(lats, dtype=float)
+		lons = numpy.asarray(lons, dtype=float)
+		twd = numpy.full(lats.shape, numpy.nan)
+		tws = numpy.full(lats.shape, numpy.nan)
+		todo = numpy.ones(lats.shape, dtype=bool)
+
+		if not isinstance(t, datetime.datetime):
+			t = numpy.asarray(t, dtype=object)
+
+		for c in self.getCoverage():
+			idx = numpy.nonzero(todo & c.containsBatch(lats, lons))[0]
+			if len(idx) == 0:
+				continue
 
+			try:
+				tt = t if isinstance(t, datetime.datetime) else t[idx]
+				d, s = c.grib.getWindAtBatch(tt, lats[idx], lons[idx])
+			except Exception as e:
+				logger.error("Grib %s getWindAtBatch failed: %s", c.grib.name, str(e))
+				continue
 
-	def getWind(self, t, bounds):
-		# TODO: get the best matching grib for lat/lon at time t
-		g = []
+			ok = ~numpy.isnan(d)
+			twd[idx[ok]] = d[ok]
+			tws[idx[ok]] = s[ok]
+			todo[idx[ok]] = False
+
+		return twd, tws
 
-		for x in self.gribs:
-			try:
-				g = g + x.getWind(t, bounds)
-			except:
-				pass
-		return g
 
+	def getWind(self, t, bounds, level=0):
+		g = self.getBestGrib(t, bounds)
+		if g is None:
+			return []
+
+		try:
+			return g.getWind(t, bounds, level) or []
+		except Exception as e:
+			logger.error("Grib %s getWind failed: %s", g.name, str(e))
+			return []
 
 
-	def getWind2D (self, tt, bounds):
-		dd = sorted(self.getWind(tt, bounds), key=lambda x: x[2][1])
 
-		ddict = {}
-		for x in dd:
-			if x[2][1] not in ddict:
-				ddict[x[2][1]] = []
-			ddict[x[2][1]].append(x)
+	# Return the wind inside bounds as (lats, lons, twd, tws): the lat and lon axes
+	# (ascending) and the 2D (lat, lon) direction and speed arrays, or None
+	def getWind2D (self, tt, bounds, level=0):
+		g = self.getBestGrib(tt, bounds)
+		if g is None:
+			return None
+
+		try:
+			data = g.getWindGrid(tt, bounds, level)
+		except Exception as e:
+			logger.error("Grib %s getWindGrid failed: %s", g.name, str(e))
+			return None
 
-		ddlist = []
-		for x, v in ddict.items():
-			ddlist.append(sorted(v, key=lambda x: x[2][0]))
+		if data is None:
+			return None
 
-		return ddlist
+		twd, tws, lats, lons = data
+		return (lats, lons, twd, tws)
 
 	def getDownloadList(self, force=False):
 		from bs4 import BeautifulSoup
@@ -164,52 +387,130 @@ class GribManager(weatherrouting.Grib):
 	def remove(self, name):
 		if self.isEnabled(name):
 			self.disable(name)
+		filePool.release(GRIB_DIR + "/" + name)
 		os.remove(GRIB_DIR + "/" + name)
-		os.remove(GRIB_DIR + "/" + name + '.idx')
 
-	def importGrib(self, path):
+		# .idx is the eccodes index written by older versions
+		for x in GribCache.files(GRIB_DIR + "/" + name) + [GRIB_DIR + "/" + name + '.idx']:
+			if os.path.exists(x):
+				os.remove(x)
+
+	# Import a grib file; with bounds, hours or thin set, import a cropped copy
+	# holding only the wind inside that area / forecast window (see gribcrop)
+	def importGrib(self, path, bounds=None, hours=None, thin=1):
 		try:
 			name = path.split("/")[-1]
-			logger.info("Importing grib %s", path)
-			copyfile(path, GRIB_DIR + "/" + name)
+			if bounds or hours or thin > 1:
+				name = croppedName(path)
+				logger.info("Importing grib %s cropped to %s", path, str(bounds))
+				cropGrib(path, GRIB_DIR + "/" + name, bounds, hours, thin)
+			else:
+				logger.info("Importing grib %s", path)
+				copyfile(path, GRIB_DIR + "/" + name)
+
 			self.enable(name)
 			return True
 		except Exception as e:
 			logger.error(str(e))
+			return False
 
-	def download(self, uri, percentageCallback, callback):
+	# Stream a (optionally bz2 compressed) grib straight into GRIB_DIR: chunks are
+	# decompressed on the fly, interrupted transfers are resumed with Range requests
+	# and the file is renamed in place only once complete; cancelled is an optional
+	# threading.Event aborting the transfer
+	def download(self, uri, percentageCallback, callback, retries=3, cancelled=None):
 		import bz2
 
 		name = uri.split("/")[-1]
+		compressed = name.endswith(".bz2")
+		dest = GRIB_DIR + "/" + name.replace(".bz2", "")
+		part = dest + ".part"
 		logger.info("Downloading grib %s", uri)
 
-		response = requests.get(uri, stream=True)
-		total_length = response.headers.get("content-length")
+		decompressor = bz2.BZ2Decompressor() if compressed else None
+		received = 0
+		total_length = None
 		last_signal_percent = -1
-		f = open(TEMP_DIR + "/" + name, "wb")
+		attempt = 0
 
-		if total_length is None:
-			pass
-		else:
-			dl = 0
-			total_length = int(total_length)
-			for data in response.iter_content(chunk_size=4096):
-				dl += len(data)
-				f.write(data)
-				done = int(100 * dl / total_length)
+		# Uncompressed partial files can be resumed from a previous session
+		if not compressed and os.path.exists(part):
+			received = os.path.getsize(part)
+		f = open(part, "ab" if received else "wb")
 
-				if last_signal_percent != done:
-					percentageCallback(done)
-					last_signal_percent = done
+		while True:
+			headers = { "Range": f"bytes={received}-" } if received else {}
+
+			try:
+				response = requests.get(uri, stream=True, headers=headers, timeout=30)
+				response.raise_for_status()
+
+				if received and response.status_code != 206:
+					# Range not honored by the server, start over
+					logger.warning("Server ignored range request, restarting download %s", uri)
+					received = 0
+					decompressor = bz2.BZ2Decompressor() if compressed else None
+					f.seek(0)
+					f.truncate()
+
+				if total_length is None and response.headers.get("content-length") is not None:
+					total_length = received + int(response.headers.get("content-length"))
+
+				for data in adaptiveChunks(response):
+					if cancelled is not None and cancelled.is_set():
+						logger.info("Grib download cancelled %s", uri)
+						response.close()
+						f.close()
+						os.remove(part)
+						callback(False)
+						return False
+
+					received += len(data)
+					f.write(decompressor.decompress(data) if decompressor else data)
+
+					if total_length:
+						done = int(100 * received / total_length)
+						if last_signal_percent != done:
+							percentageCallback(done)
+							last_signal_percent = done
+
+				if decompressor and not decompressor.eof:
+					raise requests.exceptions.ChunkedEncodingError("Truncated bz2 stream")
+				if total_length and received < total_length:
+					raise requests.exceptions.ChunkedEncodingError("Connection closed before the end of the file")
+				break
+
+			except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+				requests.exceptions.Timeout) as e:
+				attempt += 1
+				if attempt > retries:
+					logger.error("Grib download failed %s: %s", uri, str(e))
+					f.close()
+					if compressed:
+						os.remove(part)
+					callback(False)
+					return False
+
+				logger.warning("Grib download interrupted at %d bytes, resuming %s: %s", received, uri, str(e))
+
+			except Exception as e:
+				logger.error("Grib download failed %s: %s", uri, str(e))
+				f.close()
+				os.remove(part)
+				callback(False)
+				return False
 
 		f.close()
+		os.replace(part, dest)
 		logger.info("Grib download completed %s", uri)
 
-		bf = bz2.open(TEMP_DIR + "/" + name, "rb")
-		f = open(GRIB_DIR + "/" + name.replace(".bz2", ""), "wb")
-		f.write(bf.read())
-		f.close()
-		bf.close()
+		# A grib downloaded again replaces the loaded one, whose message offsets and
+		# decoded data refer to the old file
+		for x in [x for x in self.gribs if x.path == dest]:
+			self.gribs.remove(x)
+			self._release(x)
+		filePool.release(dest)
 
-		self.load(GRIB_DIR + "/" + name.replace(".bz2", ""))
+		self.load(dest)
 		callback(True)
+		return True
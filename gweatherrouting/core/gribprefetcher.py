@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import logging
+import threading
+
+logger = logging.getLogger ('gweatherrouting')
+
+
+class GribPrefetcher:
+	""" Background worker that follows TimeControl and decodes / interpolates the
+	next frames of the current viewport into the grib caches, so the map layer
+	finds them ready while time is playing.
+
+	The step and direction of the next frames are taken from the last time change.
+	"""
+
+	def __init__(self, gribManager, timeControl, frames=3):
+		self.gribManager = gribManager
+		self.timeControl = timeControl
+		self.frames = frames
+		self.bounds = None
+		self.level = 0
+		self.lastTime = timeControl.time
+		self.request = None
+		self.running = True
+
+		self.cond = threading.Condition()
+		self.thread = threading.Thread(target=self.run, args=(), daemon=True)
+		self.thread.start()
+
+		self.timeControl.connect("time-change", self.onTimeChange)
+
+	# Set the viewport bounds and pyramid level to prefetch, called by the map layer on draw
+	def setBounds(self, bounds, level=0):
+		self.bounds = bounds
+		self.level = level
+
+	def onTimeChange(self, t):
+		delta = t - self.lastTime if (t and self.lastTime) else None
+		self.lastTime = t
+
+		if not delta or self.bounds is None or not self.gribManager.hasGrib():
+			return
+
+		with self.cond:
+			# Only the latest request matters, older ones are dropped
+			self.request = ([t + delta * (i + 1) for i in range(self.frames)], self.bounds, self.level)
+			self.cond.notify()
+
+	def stop(self):
+		with self.cond:
+			self.running = False
+			self.cond.notify()
+
+	def run(self):
+		while True:
+			with self.cond:
+				while self.running and self.request is None:
+					self.cond.wait()
+
+				if not self.running:
+					return
+
+				times, bounds, level = self.request
+				self.request = None
+
+			for t in times:
+				# A newer request arrived, restart from it
+				if self.request is not None:
+					break
+
+				try:
+					self.gribManager.getWind2D(t, bounds, level)
+				except Exception as e:
+					logger.debug('Grib prefetch failed for %s: %s', str(t), str(e))
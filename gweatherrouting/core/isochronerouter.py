@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import datetime
+import numpy
+from weatherrouting.utils import EARTH_RADIUS
+from weatherrouting.routers.router import Router, RouterParam, RoutingResult, IsoPoint, RoutingNoWindException
+
+from .polartable import PolarTable
+
+# Time between two isochrones, as in the weatherrouting routers
+STEP = datetime.timedelta(hours=1)
+
+
+# Great circle distance (nm) between arrays of points
+def distanceBatch(lat1, lon1, lat2, lon2):
+	p1 = numpy.radians(lat1)
+	p2 = numpy.radians(lat2)
+	a = numpy.sin((p2 - p1) / 2.) ** 2 + numpy.cos(p1) * numpy.cos(p2) * numpy.sin(numpy.radians(lon2 - lon1) / 2.) ** 2
+	return 2. * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0., 1.)))
+
+
+# Initial great circle bearing (degrees, 0 - 360) between arrays of points
+def bearingBatch(lat1, lon1, lat2, lon2):
+	p1 = numpy.radians(lat1)
+	p2 = numpy.radians(lat2)
+	dl = numpy.radians(lon2 - lon1)
+	y = numpy.sin(dl) * numpy.cos(p2)
+	x = numpy.cos(p1) * numpy.sin(p2) - numpy.sin(p1) * numpy.cos(p2) * numpy.cos(dl)
+	return numpy.degrees(numpy.arctan2(y, x)) % 360.
+
+
+# Points reached from arrays of points sailing distance (nm) on bearing brg (degrees)
+def destinationBatch(lat, lon, distance, brg):
+	p1 = numpy.radians(lat)
+	b = numpy.radians(brg)
+	d = distance / EARTH_RADIUS
+
+	p2 = numpy.arcsin(numpy.sin(p1) * numpy.cos(d) + numpy.cos(p1) * numpy.sin(d) * numpy.cos(b))
+	l2 = numpy.radians(lon) + numpy.arctan2(numpy.sin(b) * numpy.sin(d) * numpy.cos(p1),
+		numpy.cos(d) - numpy.sin(p1) * numpy.sin(p2))
+	return numpy.degrees(p2), (numpy.degrees(l2) + 180.) % 360. - 180.
+
+
+class Isochrones(list):
+	""" Isochrones of a routing leg: lists of IsoPoint, as the ui and the routing
+	log expect them, along with the arrays of every front used by IsochroneRouter """
+
+	def __init__(self):
+		super().__init__()
+		self.fronts = []
+
+	def add(self, front, time, start):
+		self.fronts.append(front)
+
+		brg = numpy.radians(bearingBatch(start[0], start[1], front['lat'], front['lon']))
+		sdist = distanceBatch(start[0], start[1], front['lat'], front['lon'])
+		self.append([IsoPoint((a[0], a[1]), a[2], time, a[3], a[4], a[5], a[6], a[7], (a[8], a[9])) for a in zip(
+			front['lat'].tolist(), front['lon'].tolist(), front['prev'].tolist(), numpy.radians(front['twd']).tolist(),
+			front['tws'].tolist(), front['speed'].tolist(), front['brg'].tolist(), front['dist'].tolist(),
+			sdist.tolist(), brg.tolist())])
+
+	# Path from the start to point i of front k
+	def path(self, k, i):
+		path = []
+		for kk in range(k, -1, -1):
+			path.append(self[kk][i])
+			i = self.fronts[kk]['prev'][i]
+		return path[::-1]
+
+
+class IsochroneRouter(Router):
+	""" Isochrone router working on whole fronts at once.
+
+	Every front is a set of NumPy arrays; a step expands all the points of the last
+	front over all the headings with a single wind query, polar lookup and
+	destination computation, then keeps for every sector (seen from the leg start)
+	the point nearest to the next waypoint. Points not getting at least minIncrease
+	closer to the waypoint than their parent are dropped; the waypoint is reached by
+	the first point within arrivalTolerance from it.
+	"""
+
+	PARAMS = {
+		'minIncrease': RouterParam('minIncrease', 'Minimum increase (nm)', 'float',
+			'Minimum approach to the next waypoint of a new point over its parent',
+			default=0.0, lower=0.0, upper=100.0, step=0.1, digits=1),
+		'arrivalTolerance': RouterParam('arrivalTolerance', 'Arrival tolerance (nm)', 'float',
+			'Distance from the next waypoint at which it is considered reached',
+			default=10.0, lower=0.1, upper=100.0, step=0.1, digits=1),
+		'headingStep': RouterParam('headingStep', 'Heading step (°)', 'float',
+			'Angle between the headings tried from every point',
+			default=5.0, lower=1.0, upper=30.0, step=1.0, digits=0),
+		'sectorWidth': RouterParam('sectorWidth', 'Sector width (°)', 'float',
+			'Width of the sectors keeping one point of every isochrone',
+			default=1.0, lower=0.1, upper=10.0, step=0.1, digits=1)
+	}
+
+	# Wind (twd degrees, tws knots) at arrays of points, NaN where unavailable
+	def windAt(self, t, lats, lons):
+		if hasattr(self.grib, 'getWindAtBatch'):
+			return self.grib.getWindAtBatch(t, lats, lons)
+
+		twd = numpy.full(len(lats), numpy.nan)
+		tws = numpy.full(len(lats), numpy.nan)
+		for i in range(len(lats)):
+			try:
+				twd[i], tws[i] = self.grib.getWindAt(t, lats[i], lons[i])
+			except:
+				pass
+		return twd, tws
+
+	def _filterValidity(self, isonew, last):
+		ok = numpy.ones(len(isonew['lat']), dtype=bool)
+		if len(ok) == 0:
+			return isonew
+
+		if self.pointsValidity or self.pointValidity:
+			points = numpy.stack((isonew['lat'], isonew['lon']), axis=1).tolist()
+			if self.pointsValidity:
+				ok &= numpy.asarray(self.pointsValidity(points), dtype=bool)
+			else:
+				ok &= numpy.array([self.pointValidity(*p) for p in points], dtype=bool)
+
+		if self.linesValidity or self.lineValidity:
+			prev = isonew['prev']
+			lines = numpy.stack((isonew['lat'], isonew['lon'], last['lat'][prev], last['lon'][prev]), axis=1).tolist()
+			if self.linesValidity:
+				ok &= numpy.asarray(self.linesValidity(lines), dtype=bool)
+			else:
+				ok &= numpy.array([self.lineValidity(*l) for l in lines], dtype=bool)
+
+		return { k: v[ok] for k, v in isonew.items() }
+
+	# Points reached in a step from the points of front with wind at t, over all
+	# the headings; only the ones getting closer to the waypoint end are kept. None
+	# if no point of front has wind
+	def _candidates(self, t, front, end):
+		twd, tws = self.windAt(t, front['lat'], front['lon'])
+		src = numpy.nonzero(~numpy.isnan(twd) & ~numpy.isnan(tws))[0]
+		if len(src) == 0:
+			return None
+
+		twa = numpy.arange(-180., 180., self.getParamValue('headingStep'))
+		idx = numpy.repeat(src, len(twa))
+		twa = numpy.tile(twa, len(src))
+
+		brg = (twd[idx] + twa) % 360.
+		speed = self.polar.getSpeedBatch(tws[idx], numpy.radians(twa))
+		lat, lon = destinationBatch(front['lat'][idx], front['lon'][idx], speed * STEP.total_seconds() / 3600., brg)
+		dist = distanceBatch(lat, lon, end[0], end[1])
+
+		ok = dist <= front['dist'][idx] - self.getParamValue('minIncrease')
+		return { 'lat': lat[ok], 'lon': lon[ok], 'prev': idx[ok], 'dist': dist[ok],
+			'twd': twd[idx][ok], 'tws': tws[idx][ok], 'speed': speed[ok], 'brg': brg[ok] }
+
+	# Keep one point per sector seen from start, the nearest to the next waypoint
+	def _prune(self, cand, start):
+		sector = (bearingBatch(start[0], start[1], cand['lat'], cand['lon']) / self.getParamValue('sectorWidth')).astype(int)
+		order = numpy.lexsort((cand['dist'], sector))
+		_, first = numpy.unique(sector[order], return_index=True)
+		keep = order[first]
+		return { k: v[keep] for k, v in cand.items() }
+
+	# Expand the front over all headings and return the next (pruned) front
+	def expand(self, t, front, start, end):
+		cand = self._candidates(t, front, end)
+		if cand is None:
+			return None
+		return self._filterValidity(self._prune(cand, start), front)
+
+	def route(self, lastlog, t, start, end):
+		if not hasattr(self.polar, 'getSpeedBatch'):
+			self.polar = PolarTable.fromPolar(self.polar)
+
+		if lastlog is not None and isinstance(lastlog.isochrones, Isochrones) and len(lastlog.isochrones) > 0:
+			isoc = lastlog.isochrones
+		else:
+			isoc = Isochrones()
+			isoc.add({
+				'lat': numpy.array([start[0]], dtype=float), 'lon': numpy.array([start[1]], dtype=float),
+				'prev': numpy.array([-1]), 'dist': distanceBatch(numpy.array([start[0]]), numpy.array([start[1]]), end[0], end[1]),
+				'twd': numpy.zeros(1), 'tws': numpy.zeros(1), 'speed': numpy.zeros(1), 'brg': numpy.zeros(1)
+			}, t, start)
+
+		legStart = isoc[0][0].pos
+		front = self.expand(t, isoc.fronts[-1], legStart, end)
+
+		# Out of the grib scope or unable to get closer: end the leg at the point
+		# nearest to the waypoint
+		if front is None or len(front['lat']) == 0:
+			if len(isoc) < 2:
+				if front is None:
+					raise RoutingNoWindException()
+				raise Exception('Unable to get closer to the next waypoint')
+
+			k = len(isoc) - 1
+			path = isoc.path(k, int(numpy.argmin(isoc.fronts[k]['dist'])))
+			return RoutingResult(time=path[-1].time, path=path, position=path[-1].pos, isochrones=isoc)
+
+		isoc.add(front, t + STEP, legStart)
+
+		path = []
+		arrived = numpy.nonzero(front['dist'] < self.getParamValue('arrivalTolerance'))[0]
+		if len(arrived) > 0:
+			path = isoc.path(len(isoc) - 1, int(arrived[numpy.argmin(front['dist'][arrived])]))
+
+		return RoutingResult(time=t + STEP, path=path, position=path[-1].pos if path else start, isochrones=isoc)
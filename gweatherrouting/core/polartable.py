@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import os
+import math
+import logging
+import threading
+import numpy
+import weatherrouting
+
+logger = logging.getLogger ('gweatherrouting')
+
+POLARS_DIR = os.path.abspath(os.path.dirname(__file__)) + '/../data/polars/'
+
+TWS_STEP = 0.1
+TWA_STEP = 1.0
+
+
+# Path of a polar file, either a bundled polar name or a path; bundled polars
+# come first, so a file of the working directory never replaces one of them
+def polarPath(polarFile):
+	if os.path.exists(POLARS_DIR + polarFile):
+		return POLARS_DIR + polarFile
+	return polarFile
+
+
+# Interpolation of x on the polar axis values as Polar.getSpeed does it: the
+# indexes of the two bracketing values and the weight of the second one
+def axisWeights(values, xs, clamp=False):
+	i1 = numpy.zeros(len(xs), dtype=int)
+	i2 = numpy.zeros(len(xs), dtype=int)
+	w = numpy.zeros(len(xs))
+
+	for n, x in enumerate(xs):
+		for k in range(0, len(values)):
+			if x >= values[k]:
+				i1[n] = k
+		for k in range(len(values) - 1, 0, -1):
+			if x <= values[k]:
+				i2[n] = k
+		if clamp and i1[n] > i2[n]:
+			i2[n] = len(values) - 1
+		if i1[n] != i2[n]:
+			w[n] = (x - values[i1[n]]) / (values[i2[n]] - values[i1[n]])
+
+	return i1, i2, w
+
+
+class PolarTable(weatherrouting.Polar):
+	""" Polar with its speeds precomputed on a dense TWS x TWA grid.
+
+	The grid has a node every TWS_STEP knots (from 0 to the last polar TWS) and
+	every TWA_STEP degrees (0 to 180); nodes hold the speeds interpolated as
+	weatherrouting.Polar does, so a bilinear lookup on the grid gives the same speeds
+	when the polar TWS / TWA fall on grid nodes. TWS over the polar is clamped to
+	its last column, as Polar.getSpeed does; TWS columns missing in some speed rows
+	are ignored.
+
+	Instances are shared (see PolarRegistry): the polar axes and speeds are tuples
+	and the table is read only. The only mutable state is vmgdict, the memo of
+	Polar.getMaxVMGTWA filled on every new (tws, twa) query; its entries only
+	depend on the polar, so sharing it between routings is safe.
+	"""
+
+	def __init__(self, path, f=None):
+		super().__init__(path, f)
+		self.build()
+
+	# Table of an already parsed polar
+	@staticmethod
+	def fromPolar(polar):
+		table = PolarTable.__new__(PolarTable)
+		table.tws = polar.tws
+		table.twa = polar.twa
+		table.speedTable = polar.speedTable
+		table.vmgdict = {}
+		table.build()
+		return table
+
+	def build(self):
+		self.tws = tuple(self.tws)
+		self.twa = tuple(self.twa)
+		self.speedTable = tuple(tuple(x) for x in self.speedTable)
+
+		ncols = min([len(self.tws)] + [len(x) for x in self.speedTable])
+		tws = self.tws[:ncols]
+		speeds = numpy.array([x[:ncols] for x in self.speedTable], dtype=float)
+
+		self.twsMax = max(tws)
+		ntws = int(math.ceil(self.twsMax / TWS_STEP)) + 1
+		ntwa = int(round(180. / TWA_STEP)) + 1
+
+		b1, b2, wx = axisWeights(tws, numpy.minimum(numpy.arange(ntws) * TWS_STEP, self.twsMax), clamp=True)
+		a1, a2, wy = axisWeights(self.twa, numpy.radians(numpy.minimum(numpy.arange(ntwa) * TWA_STEP, 180.)))
+		a1, a2, wy = a1[:, None], a2[:, None], wy[:, None]
+
+		s12 = speeds[a1, b1] + (speeds[a2, b1] - speeds[a1, b1]) * wy
+		s34 = speeds[a1, b2] + (speeds[a2, b2] - speeds[a1, b2]) * wy
+		self.table = s12 + (s34 - s12) * wx
+		self.table.flags.writeable = False
+		self.rows = self.table.tolist()
+
+	def getSpeed(self, tws, twa):
+		""" Returns the speed (in knots) given tws (in knots) and twa (in radians) """
+		x = min(max(tws, 0.), self.twsMax) / TWS_STEP
+		y = min(abs(math.degrees(twa)), 180.) / TWA_STEP
+
+		j = min(int(x), len(self.rows[0]) - 2)
+		i = min(int(y), len(self.rows) - 2)
+		fx = x - j
+		fy = y - i
+
+		r1 = self.rows[i]
+		r2 = self.rows[i + 1]
+		s1 = r1[j] + (r1[j + 1] - r1[j]) * fx
+		s2 = r2[j] + (r2[j + 1] - r2[j]) * fx
+		return s1 + (s2 - s1) * fy
+
+	# Vectorized getSpeed over arrays of tws (knots) and twa (radians)
+	def getSpeedBatch(self, tws, twa):
+		x = numpy.clip(numpy.asarray(tws, dtype=float), 0., self.twsMax) / TWS_STEP
+		y = numpy.minimum(numpy.abs(numpy.degrees(twa)), 180.) / TWA_STEP
+
+		j = numpy.minimum(x.astype(int), self.table.shape[1] - 2)
+		i = numpy.minimum(y.astype(int), self.table.shape[0] - 2)
+		fx = x - j
+		fy = y - i
+
+		s1 = self.table[i, j] + (self.table[i, j + 1] - self.table[i, j]) * fx
+		s2 = self.table[i + 1, j] + (self.table[i + 1, j + 1] - self.table[i + 1, j]) * fx
+		return s1 + (s2 - s1) * fy
+
+
+class PolarRegistry:
+	""" Parsed polars, shared by the ui and the routings: every polar file is parsed
+	once into a PolarTable and parsed again only when its mtime changes """
+
+	def __init__(self):
+		self.polars = {}
+		self.lock = threading.Lock()
+
+	# Return the PolarTable of polarFile (a bundled polar name or a path)
+	def get(self, polarFile):
+		path = os.path.abspath(polarPath(polarFile))
+		mtime = os.stat(path).st_mtime
+
+		with self.lock:
+			entry = self.polars.get(path)
+			if entry and entry[0] == mtime:
+				return entry[1]
+
+		logger.debug('Parsing polar %s', path)
+		polar = PolarTable(path)
+
+		with self.lock:
+			self.polars[path] = (mtime, polar)
+		return polar
+
+	def clear(self):
+		with self.lock:
+			self.polars = {}
+
+
+polarRegistry = PolarRegistry()
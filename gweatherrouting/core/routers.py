@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import weatherrouting
+
+from .polartable import polarRegistry
+from .isochronerouter import IsochroneRouter
+
+# Routing algorithms of weatherrouting along with the ones of gweatherrouting
+def listRoutingAlgorithms():
+	return weatherrouting.listRoutingAlgorithms() + [
+		{
+			'name': 'IsochroneRouter',
+			'class': IsochroneRouter
+		}
+	]
+
+# Create a routing of track over the wind of gribManager; other options
+# (startPosition, pointsValidity, linesValidity) are passed to weatherrouting.Routing
+def createRouting(algorithm, polarFile, track, gribManager, startDatetime, **options):
+	return weatherrouting.Routing(
+		algorithm,
+		polarRegistry.get(polarFile),
+		track,
+		gribManager,
+		startDatetime=startDatetime,
+		**options
+	)
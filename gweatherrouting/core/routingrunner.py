@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import copy
+import json
+import time
+import logging
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import gpxpy
+import weatherrouting
+from weatherrouting import RoutingNoWindException
+
+from . import utils
+from .grib import Grib
+from .gribdecoder import GribDecoder
+from .gribmanager import GribManager
+from .routers import createRouting, listRoutingAlgorithms
+
+logger = logging.getLogger ('gweatherrouting')
+
+# Job keys and their defaults; every entry of 'routings' overrides them
+JOB_DEFAULTS = {
+	'name': 'routing',
+	'gribs': [],
+	'polar': None,
+	'algorithm': 'LinearBestIsoRouter',
+	'params': {},
+	'track': [],
+	'start': None,
+	'startPosition': None,
+	'coastlineChecks': False,
+	'maxSteps': 5000
+}
+
+# Grib managers of a worker process, by grib set
+_gribManagers = {}
+
+# Columns of the departures comparison table: key, header, format
+TABLE_COLUMNS = [
+	('start', 'Departure', '{}'),
+	('eta', 'ETA', '{}'),
+	('hours', 'Hours', '{:.1f}'),
+	('distance', 'Distance (nm)', '{:.1f}'),
+	('maxTws', 'Max TWS (kt)', '{:.1f}')
+]
+
+
+# Read a job file, returning the list of routing jobs it describes
+def loadJobs(path):
+	with open(path, 'r') as f:
+		data = json.loads(f.read())
+
+	base = dict(JOB_DEFAULTS)
+	base.update({ k: v for k, v in data.items() if k != 'routings' })
+
+	jobs = []
+	for i, r in enumerate(data.get('routings', [{}])):
+		job = dict(base)
+		job.update(r)
+		if 'name' not in r and len(data.get('routings', [])) > 1:
+			job['name'] = f"{base['name']}-{i}"
+		jobs.append(job)
+
+	for job in jobs:
+		if not job['polar'] or len(job['track']) == 0 or len(job['gribs']) == 0:
+			raise ValueError(f"Job {job['name']} needs polar, track and gribs")
+	return jobs
+
+
+# Yield departure times from start to end (included) every interval
+def departures(start, end, interval):
+	t = start
+	while t <= end:
+		yield t
+		t += interval
+
+
+# Expand job in one job per departure time of starts
+def sweepJobs(job, starts):
+	jobs = []
+	for t in starts:
+		j = dict(JOB_DEFAULTS)
+		j.update(job)
+		j['start'] = t.isoformat()
+		j['name'] = f"{job['name']}-{t.strftime('%Y%m%d%H%M')}"
+		jobs.append(j)
+	return jobs
+
+
+# Rows of the comparison table of the results of a run, by departure time
+def sweepTable(summary):
+	rows = []
+	for r in sorted(summary['results'], key=lambda r: r['start']):
+		row = { k: r.get(k) for k, _, _ in TABLE_COLUMNS }
+		row['name'] = r['name']
+		row['status'] = r['status']
+		row['error'] = r.get('error')
+		rows.append(row)
+	return rows
+
+
+def formatTable(rows):
+	table = [[h for _, h, _ in TABLE_COLUMNS]]
+	for r in rows:
+		if r['status'] != 'ok':
+			table.append([r['start'], r['error']])
+			continue
+		table.append([fmt.format(r[k]) if r[k] is not None else '-' for k, _, fmt in TABLE_COLUMNS])
+
+	widths = [max(len(x[i]) for x in table if len(x) == len(TABLE_COLUMNS)) for i in range(len(TABLE_COLUMNS))]
+	return '\n'.join('  '.join(c.ljust(widths[i]) for i, c in enumerate(x)).rstrip() for x in table)
+
+
+# Gribs are prepared before the workers start, so they only map the decoded
+# cache read only and share its pages with each other; the manager is bare, the
+# workers neither read nor write the user storage
+def getGribManager(gribs):
+	key = tuple(gribs)
+	if key not in _gribManagers:
+		gm = GribManager(bare=True)
+		for x in gribs:
+			gm.load(x, lazy=True, readonly=True)
+		_gribManagers[key] = gm
+	return _gribManagers[key]
+
+
+# Algorithm class of a job: a subclass with its own copy of PARAMS, every param
+# set to its default and then to the job params, so the jobs run by the same
+# worker never see each other's params
+def getAlgorithm(name, params=None):
+	for x in listRoutingAlgorithms():
+		if x['name'] != name:
+			continue
+
+		jobParams = {}
+		for k, p in x['class'].PARAMS.items():
+			jobParams[k] = copy.copy(p)
+			jobParams[k].value = p.default
+
+		for k, v in (params or {}).items():
+			if k not in jobParams:
+				raise ValueError(f'Unknown parameter {k} of {name}')
+			jobParams[k].value = v
+
+		return type(name, (x['class'],), { 'PARAMS': jobParams })
+	raise ValueError(f'Unknown routing algorithm {name}')
+
+
+# Run a single routing job (in a worker process) and return its result
+def runJob(job):
+	t0 = time.time()
+	start = datetime.datetime.fromisoformat(job['start'])
+	result = { 'name': job['name'], 'start': job['start'], 'status': 'ok' }
+
+	try:
+		algorithm = getAlgorithm(job['algorithm'], job['params'])
+
+		routing = createRouting(
+			algorithm,
+			job['polar'],
+			[tuple(x) for x in job['track']],
+			getGribManager(job['gribs']),
+			start,
+			startPosition=tuple(job['startPosition']) if job['startPosition'] else None,
+			pointsValidity=utils.pointsValidity if job['coastlineChecks'] else None
+		)
+
+		res = None
+		steps = 0
+		while not routing.end:
+			if steps >= job['maxSteps']:
+				raise Exception(f"Routing not completed in {job['maxSteps']} steps")
+			res = routing.step()
+			steps += 1
+
+		path = [(wp.pos[0], wp.pos[1], wp.time.isoformat(), wp.twd, wp.tws, wp.speed, wp.brg) for wp in res.path]
+		distance = 0.0
+		for a, b in zip(path, path[1:]):
+			distance += weatherrouting.utils.pointDistance(a[0], a[1], b[0], b[1])
+
+		result.update({
+			'eta': path[-1][2] if len(path) > 0 else None,
+			'hours': (res.path[-1].time - start).total_seconds() / 3600. if len(path) > 0 else None,
+			'distance': distance,
+			'maxTws': max((x[4] for x in path), default=None),
+			'steps': steps,
+			'path': path
+		})
+	except RoutingNoWindException:
+		result.update({ 'status': 'error', 'error': 'No wind information along the route' })
+	except Exception as e:
+		result.update({ 'status': 'error', 'error': str(e) })
+
+	result['elapsed'] = time.time() - t0
+	return result
+
+
+class RoutingRunner:
+	""" Headless runner of routing jobs over a process pool.
+
+	The gribs of the jobs are parsed and fully decoded once in the grib caches
+	before starting, so every worker only maps the decoded wind.
+	"""
+
+	def __init__(self, workers=None):
+		self.workers = workers or os.cpu_count() or 1
+
+	def prepare(self, jobs):
+		decoder = GribDecoder(self.workers)
+		for path in sorted(set(x for job in jobs for x in job['gribs'])):
+			logger.info('Preparing grib %s', path)
+			decoder.decode(Grib.parse(path))
+
+	def run(self, jobs, callback=None):
+		t0 = time.time()
+		self.prepare(jobs)
+
+		results = []
+		ctx = multiprocessing.get_context('spawn')
+		with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)), mp_context=ctx) as executor:
+			futures = { executor.submit(runJob, job): i for i, job in enumerate(jobs) }
+			for f in as_completed(futures):
+				r = f.result()
+				results.append((futures[f], r))
+				logger.info('Routing %s: %s (%.1fs)', r['name'], r['status'], r['elapsed'])
+				if callback:
+					callback(r, len(results), len(jobs))
+
+		# Results in submission order (job names may repeat)
+		results = [r for _, r in sorted(results, key=lambda x: x[0])]
+
+		elapsed = time.time() - t0
+		return {
+			'workers': self.workers,
+			'elapsed': elapsed,
+			'routingTime': sum(r['elapsed'] for r in results),
+			'meanRoutingTime': sum(r['elapsed'] for r in results) / max(1, len(results)),
+			'completed': len([r for r in results if r['status'] == 'ok']),
+			'results': results
+		}
+
+	# Write results.json and a GPX file for every completed routing in outdir
+	@staticmethod
+	def writeResults(summary, outdir):
+		os.makedirs(outdir, exist_ok=True)
+
+		for r in summary['results']:
+			if r['status'] != 'ok':
+				continue
+
+			gpx = gpxpy.gpx.GPX()
+			track = gpxpy.gpx.GPXTrack(name=r['name'])
+			segment = gpxpy.gpx.GPXTrackSegment()
+			track.segments.append(segment)
+			gpx.tracks.append(track)
+
+			for x in r['path']:
+				segment.points.append(gpxpy.gpx.GPXTrackPoint(x[0], x[1], time=datetime.datetime.fromisoformat(x[2])))
+
+			with open(os.path.join(outdir, r['name'] + '.gpx'), 'w') as f:
+				f.write(gpx.to_xml())
+
+		with open(os.path.join(outdir, 'results.json'), 'w') as f:
+			f.write(json.dumps(summary, indent=2))
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Run routing jobs without the user interface')
+	parser.add_argument('jobfile', help='JSON job file')
+	parser.add_argument('-o', '--output', default='.', help='output directory for results.json and GPX files')
+	parser.add_argument('-w', '--workers', type=int, help='worker processes (default: all cores)')
+	parser.add_argument('-s', '--sweep', nargs=3, metavar=('FROM', 'TO', 'HOURS'),
+		help='route the first job at every departure from FROM to TO (ISO dates) every HOURS')
+	args = parser.parse_args()
+
+	try:
+		jobs = loadJobs(args.jobfile)
+		if args.sweep:
+			jobs = sweepJobs(jobs[0], departures(datetime.datetime.fromisoformat(args.sweep[0]),
+				datetime.datetime.fromisoformat(args.sweep[1]), datetime.timedelta(hours=float(args.sweep[2]))))
+
+		for job in jobs:
+			if not job['start']:
+				raise ValueError(f"Job {job['name']} needs a start time")
+	except Exception as e:
+		print(f'Invalid job file {args.jobfile}: {e}', file=sys.stderr)
+		sys.exit(1)
+
+	runner = RoutingRunner(args.workers)
+	summary = runner.run(jobs, lambda r, i, n: print(f"[{i}/{n}] {r['name']}: {r['status']} " +
+		(f"eta {r['eta']}, {r['distance']:.1f} nm" if r['status'] == 'ok' else r['error']) + f" ({r['elapsed']:.1f}s)"))
+	RoutingRunner.writeResults(summary, args.output)
+
+	if args.sweep:
+		print(formatTable(sweepTable(summary)))
+
+	print(f"{summary['completed']}/{len(jobs)} routings completed in {summary['elapsed']:.1f}s " +
+		f"with {summary['workers']} workers (routing time {summary['routingTime']:.1f}s)")
+
+
+if __name__ == '__main__':
+	main()
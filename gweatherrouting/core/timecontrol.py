@@ -21,6 +21,7 @@ class TimeControl(EventDispatcher):
 	DFORMAT = "%Y/%m/%d, %H:%M"
 
 	def __init__(self):
+		EventDispatcher.__init__(self)
 		self.time = None
 		self.now()
 
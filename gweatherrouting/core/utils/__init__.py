@@ -16,7 +16,11 @@ For detail about GNU see <http://www.gnu.org/licenses/>.
 '''
 import math
 import os
+import sys
 import json
+import threading
+import collections
+import numpy
 import latlon
 from geojson_utils import point_in_polygon
 
@@ -96,7 +100,7 @@ def pointValidity (lat, lon):
 	return not pointInCountry(lat, lon)
 
 def pointsValidity (latlons):
-	return list(map(pointValidity, latlons))
+	return [pointValidity(lat, lon) for lat, lon in latlons]
 
 def uniqueName(name, collection = None):
 	if not collection:
@@ -143,28 +147,97 @@ def reduce360 (alfa):
 
 
 
-class DictCache(dict):
-	def __init__(self, max_entries=50):
-		self.entries = []
+class LRUCache:
+	""" Thread-safe LRU cache bounded by entry count and by approximate size in bytes
+	of its values (numpy payloads are measured by nbytes, memory mapped arrays
+	are not counted since their pages belong to the page cache) """
+
+	def __init__(self, max_entries=50, max_bytes=None):
 		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.entries = collections.OrderedDict()
+		self.lock = threading.RLock()
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	@staticmethod
+	def sizeOf(value):
+		if isinstance(value, numpy.memmap):
+			return 0
+		if isinstance(value, numpy.ndarray):
+			return value.nbytes
+		if isinstance(value, (tuple, list)):
+			return sum(map(LRUCache.sizeOf, value))
+		if isinstance(value, dict):
+			return sum(map(LRUCache.sizeOf, value.values()))
+		return sys.getsizeof(value)
+
+	def get(self, key, default=None):
+		with self.lock:
+			if key not in self.entries:
+				self.misses += 1
+				return default
+
+			self.hits += 1
+			self.entries.move_to_end(key)
+			return self.entries[key][0]
+
+	def __getitem__(self, key):
+		with self.lock:
+			if key not in self.entries:
+				self.misses += 1
+				raise KeyError(key)
+			return self.get(key)
 
 	def __setitem__(self, key, value):
-		super(DictCache, self).__setitem__(key, value)
-		self.__dict__.update({key: value})
-		self.entries.append(key)
+		size = LRUCache.sizeOf(value)
+
+		with self.lock:
+			if key in self.entries:
+				self.bytes -= self.entries.pop(key)[1]
 
-		if len(self.entries) > self.max_entries:
-			td = self.entries[0]
-			self.entries = self.entries[1::]
+			self.entries[key] = (value, size)
+			self.bytes += size
+
+			while len(self.entries) > 1 and (len(self.entries) > self.max_entries or \
+				(self.max_bytes is not None and self.bytes > self.max_bytes)):
+				_, (_, s) = self.entries.popitem(last=False)
+				self.bytes -= s
+				self.evictions += 1
 
 	def __delitem__(self, key):
-		super(DictCache, self).__delitem__(key)
-		del self.__dict__[key]
-		self.entries.remove(key)
+		with self.lock:
+			self.bytes -= self.entries.pop(key)[1]
+
+	def __contains__(self, key):
+		return key in self.entries
+
+	def __len__(self):
+		return len(self.entries)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.bytes = 0
+
+	def stats(self):
+		return {
+			'entries': len(self.entries),
+			'bytes': self.bytes,
+			'hits': self.hits,
+			'misses': self.misses,
+			'evictions': self.evictions
+		}
+
+# Kept for compatibility
+DictCache = LRUCache
 
 
 class EventDispatcher:
-	handlers = {}
+	def __init__(self):
+		self.handlers = {}
 
 	def connect(self, evt, f):
 		if evt not in self.handlers:
@@ -29,7 +29,8 @@ from gi.repository import Gtk, Gdk, OsmGpsMap #Keybinder
 from .gribmanagerwindow import GribFileFilter
 from .maplayers import GribMapLayer, AISMapLayer, ToolsMapLayer, GeoMapLayer
 
-from ..core import TimeControl
+from ..core import TimeControl, Grib
+from ..core.gribmanager import GribCoverage
 from .chartstack_poi import ChartStackPOI
 from .chartstack_track import ChartStackTrack
 from .chartstack_routing import ChartStackRouting
@@ -255,7 +256,31 @@ class ChartStack(Gtk.Box, ChartStackPOI, ChartStackTrack, ChartStackRouting):
 					edialog.destroy ()
 
 			elif extension in ['grb', 'grb2', 'grib']:
-				if self.core.gribManager.importGrib(filepath):
+				p1, p2 = self.map.get_bbox()
+				p1lat, p1lon = p1.get_degrees()
+				p2lat, p2lon = p2.get_degrees()
+				# p1 is the west corner: p1lon > p2lon when the view crosses the antimeridian
+				viewBounds = ((min(p1lat, p2lat), p1lon), (max(p1lat, p2lat), p2lon))
+
+				# Cropping is offered only when the grib extends beyond the visible area;
+				# an unreadable grib is left to importGrib to report
+				try:
+					crop = not GribCoverage(Grib.parseMetadata(filepath)).within(viewBounds)
+				except Exception:
+					crop = False
+
+				bounds = None
+				if crop:
+					qdialog = Gtk.MessageDialog (self.parent, 0, Gtk.MessageType.QUESTION, Gtk.ButtonsType.YES_NO,
+						"Import only the visible area?")
+					qdialog.format_secondary_text ("The grib covers a larger area than the visible map. Importing only "
+						"the wind inside the visible area makes a smaller file that loads and draws faster; "
+						"choose No to import the whole grib.")
+					if qdialog.run () == Gtk.ResponseType.YES:
+						bounds = viewBounds
+					qdialog.destroy ()
+
+				if self.core.gribManager.importGrib(filepath, bounds):
 					edialog = Gtk.MessageDialog (self.parent, 0, Gtk.MessageType.INFO, Gtk.ButtonsType.OK, "Done")
 					edialog.format_secondary_text ("File opened, loaded grib")
 					edialog.run ()
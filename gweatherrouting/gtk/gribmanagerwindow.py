@@ -19,7 +19,7 @@ import logging
 from threading import Thread
 import gi
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, GObject, Gdk
+from gi.repository import Gtk, GObject, Gdk, GLib
 
 logger = logging.getLogger ('gweatherrouting')
 
@@ -50,12 +50,17 @@ class GribManagerWindow:
 
 		self.updateLocalGribs()
 
+		self.gribManager.downloadManager.connect('downloads-progress', self.onGribDownloadPercentage)
+		self.gribManager.downloadManager.connect('download-completed', self.onGribDownloadCompleted)
+
 		Thread(target=self.downloadList, args=()).start()
 
 	def show(self):
 		self.window.show_all()
 
 	def close(self):
+		self.gribManager.downloadManager.disconnect('downloads-progress', self.onGribDownloadPercentage)
+		self.gribManager.downloadManager.disconnect('download-completed', self.onGribDownloadCompleted)
 		self.window.hide()
 
 	def downloadList(self):
@@ -134,18 +139,30 @@ class GribManagerWindow:
 
 		self.updateLocalGribs()
 
+	# Download events are dispatched by the download workers: widgets are updated
+	# from the main loop
 	def onGribDownloadPercentage (self, percentage):
+		GLib.idle_add (self.updateDownloadPercentage, percentage)
+
+	def onGribDownloadCompleted (self, job):
+		GLib.idle_add (self.updateDownloadCompleted, job)
+
+	def updateDownloadPercentage (self, percentage):
 		if percentage % 10 == 0:
 			logger.info('Downloading grib: %d%% completed', percentage)
 		self.builder.get_object('download-progress').set_fraction(percentage / 100.)
 		self.builder.get_object('download-progress').set_text(f"{percentage}%")
 		# self.statusbar.push (self.statusbar.get_context_id ('Info'), 'Downloading grib: %d%% completed' % percentage)
 
-	def onGribDownloadCompleted (self, status):
-		self.builder.get_object('download-progress').set_text("Download completed!")
+	def updateDownloadCompleted (self, job):
+		if job.status == 'completed':
+			self.builder.get_object('download-progress').set_text("Download completed!")
+		else:
+			self.builder.get_object('download-progress').set_text(f"Download {job.status}")
 		self.updateLocalGribs()
 
-		GObject.timeout_add (3000, self.builder.get_object('download-progress').hide)
+		if not self.gribManager.downloadManager.isDownloading():
+			GObject.timeout_add (3000, self.builder.get_object('download-progress').hide)
 
 	def onGribClick(self, widget, event):
 		if event.button == 3:
@@ -173,6 +190,4 @@ class GribManagerWindow:
 
 	def onGribDownload (self, widget):
 		self.builder.get_object('download-progress').show()
-		t = Thread(target=self.gribManager.download, args=(
-			self.selectedGrib, self.onGribDownloadPercentage, self.onGribDownloadCompleted,))
-		t.start ()
+		self.gribManager.downloadManager.enqueue(self.selectedGrib)
@@ -25,6 +25,8 @@ except:
 from gi.repository import GObject, OsmGpsMap
 from ..style import *
 from ...core.utils import pointInCountry
+from ...core.gribprefetcher import GribPrefetcher
+from ...core.grib import pyramidLevel
 from ...common import windColor
 
 
@@ -36,6 +38,7 @@ class GribMapLayer(GObject.GObject, OsmGpsMap.MapLayer):
 		self.timeControl = timeControl
 		self.timeControl.connect("time-change", self.onTimeChange)
 		self.settingsManager = settingsManager
+		self.prefetcher = GribPrefetcher(gribManager, timeControl)
 
 	def setVisible(self, visible):
 		self.visible = visible
@@ -84,33 +87,45 @@ class GribMapLayer(GObject.GObject, OsmGpsMap.MapLayer):
 		cr.set_source_rgb(1, 0, 0)
 		# print (p1lat, p1lon, p2lat, p2lon)
 
+		# p1 is the west corner: p1lon > p2lon when the view crosses the antimeridian
 		bounds = (
-			(min(p1lat, p2lat), min(p1lon, p2lon)),
-			(max(p1lat, p2lat), max(p1lon, p2lon)),
+			(min(p1lat, p2lat), p1lon),
+			(max(p1lat, p2lat), p2lon),
 		)
-		data = self.gribManager.getWind2D(self.timeControl.time, bounds)
 
-		if not data or len(data) == 0:
+		# Zoomed out, read a decimated level of the wind pyramid instead of
+		# striding over every grid point
+		level, scale = pyramidLevel(max(1, int(gpsmap.get_scale() / 500.0)))
+
+		self.prefetcher.setBounds(bounds, level)
+		data = self.gribManager.getWind2D(self.timeControl.time, bounds, level)
+
+		if data is None:
 			return
 
-		scale = int(gpsmap.get_scale() / 500.0)
-		if scale < 1:
-			scale = 1
+		lats, lons, twd, tws = data
+		lats = lats[::scale].tolist()
+		lons = lons[::scale].tolist()
+		twd = twd[::scale, ::scale].tolist()
+		tws = tws[::scale, ::scale].tolist()
+
+		if len(lats) == 0 or len(lons) == 0:
+			return
 
-		cr.set_line_width(1.5 / (math.ceil(len(data) / 60)))
+		cr.set_line_width(1.5 / (math.ceil(len(lons) / 60)))
 		cr.set_line_width(1)
 
 		# Draw arrows
-		for x in data[::scale]:
-			for y in x[::scale]:
+		for i, lat in enumerate(lats):
+			for j, lon in enumerate(lons):
 				if not self.settingsManager.gribArrowOnGround:
-					if pointInCountry(y[2][0], y[2][1]):
+					if pointInCountry(lat, (lon + 180.) % 360. - 180.):
 						continue
 
 				xx, yy = gpsmap.convert_geographic_to_screen(
-					OsmGpsMap.MapPoint.new_degrees(y[2][0], y[2][1])
+					OsmGpsMap.MapPoint.new_degrees(lat, lon)
 				)
-				self.drawWindArrow(cr, xx, yy, y[0], y[1])
+				self.drawWindArrow(cr, xx, yy, twd[i][j], tws[i][j])
 
 		# Draw gradients
 		# for i in range(0, len(data) - scale, scale):
@@ -49,7 +49,7 @@ class ToolsMapLayer (GObject.GObject, OsmGpsMap.MapLayer):
 		self.poiMovingCallback = None
 
 		# TODO: need to create a new class for data
-		core.connect('data', self.dataHandler)
+		core.connect('boatPosition', self.dataHandler)
 
 
 	def toggleMob(self, lat, lon):
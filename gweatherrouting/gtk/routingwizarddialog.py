@@ -19,8 +19,7 @@ import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
 
-import weatherrouting
-from ..core import TimeControl
+from ..core import TimeControl, polarRegistry, listRoutingAlgorithms
 from .timepickerdialog import TimePickerDialog
 from .widgets.polar import PolarWidget
 
@@ -62,7 +61,7 @@ class RoutingWizardDialog:
 
 
 		routing_store = self.builder.get_object('routing-store')
-		for r in weatherrouting.listRoutingAlgorithms():
+		for r in listRoutingAlgorithms():
 			routing_store.append ([r['name']])
 		self.builder.get_object('routing-select').set_active (0)
 
@@ -86,7 +85,7 @@ class RoutingWizardDialog:
 		return self.dialog.destroy()
 
 	def onRoutingAlgoSelect(self, widget):
-		ralgo = weatherrouting.listRoutingAlgorithms()[self.builder.get_object('routing-select').get_active ()]['class']
+		ralgo = listRoutingAlgorithms()[self.builder.get_object('routing-select').get_active ()]['class']
 
 		if len(ralgo.PARAMS.keys()) == 0:
 			self.builder.get_object('router-params').hide()
@@ -130,7 +129,7 @@ class RoutingWizardDialog:
 
 	def onBoatSelect(self, widget):
 		pfile = self.polars [self.builder.get_object('boat-select').get_active ()]
-		self.polar = weatherrouting.Polar (os.path.abspath(os.path.dirname(__file__)) + '/../data/polars/' + pfile)
+		self.polar = polarRegistry.get(pfile)
 		self.polarWidget.setPolar (self.polar)
 
 	def onTimeSelect(self, widget):
@@ -153,7 +152,7 @@ class RoutingWizardDialog:
 		return self.core.trackManager[self.builder.get_object('track-select').get_active ()]
 
 	def getSelectedAlgorithm (self):
-		return weatherrouting.listRoutingAlgorithms()[self.builder.get_object('routing-select').get_active ()]['class']
+		return listRoutingAlgorithms()[self.builder.get_object('routing-select').get_active ()]['class']
 
 	def getSelectedPolar (self):
 		return self.polars [self.builder.get_object('boat-select').get_active ()]
@@ -13,15 +13,15 @@ GNU General Public License for more details.
 
 For detail about GNU see <http://www.gnu.org/licenses/>.
 '''
-import os
 import math
 import logging
 import gi
-from weatherrouting import Polar
 
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk
 
+from ...core import polarRegistry
+
 logger = logging.getLogger ('gweatherrouting')
 
 class PolarWidget(Gtk.DrawingArea):
@@ -46,12 +46,9 @@ class PolarWidget(Gtk.DrawingArea):
 	def loadPolar(self, polarFile):
 		polar = None
 		try:
-			polar = Polar (os.path.abspath(os.path.dirname(__file__)) + '/../../data/polars/' + polarFile)
+			polar = polarRegistry.get(polarFile)
 		except:
-			try:
-				polar = Polar (polarFile)
-			except:
-				logger.error ('Error loading polar file %s', polarFile)
+			logger.error ('Error loading polar file %s', polarFile)
 
 		self.setPolar(polar)
 
@@ -35,6 +35,8 @@ from kivy_garden.mapview.downloader import Downloader
 from kivy_garden.mapview.view import MapLayer
 
 from ...common import windColor
+from ...core.gribprefetcher import GribPrefetcher
+from ...core.grib import pyramidLevel
 
 
 class GribMapLayer(MapLayer):
@@ -43,6 +45,7 @@ class GribMapLayer(MapLayer):
 		self.gribManager = gribManager
 		self.timeControl = timeControl
 		self.timeControl.connect("time-change", self.onTimeChange)
+		self.prefetcher = GribPrefetcher(gribManager, timeControl)
 		self.arrowOpacity = 0.3
 		
 
@@ -86,17 +89,13 @@ class GribMapLayer(MapLayer):
 
 		p1lat, p1lon, p2lat, p2lon = bbox
 
+		# p1 is the west corner: p1lon > p2lon when the view crosses the antimeridian
 		bounds = (
-			(min(p1lat, p2lat), min(p1lon, p2lon)),
-			(max(p1lat, p2lat), max(p1lon, p2lon)),
+			(min(p1lat, p2lat), p1lon),
+			(max(p1lat, p2lat), p2lon),
 		)
-		data = self.gribManager.getWind2D(self.timeControl.time, bounds)
-
 		self.canvas.clear()
 
-		if not data or len(data) == 0:
-			return
-
 		# scale = int(math.fabs(zoom - 8))
 		if zoom > 8:
 			scale = 1
@@ -117,10 +116,22 @@ class GribMapLayer(MapLayer):
 		elif zoom > 0:
 			scale = 9
 
+		level, scale = pyramidLevel(scale)
+		self.prefetcher.setBounds(bounds, level)
+		data = self.gribManager.getWind2D(self.timeControl.time, bounds, level)
+
+		if data is None:
+			return
+
+		lats, lons, twd, tws = data
+		lats = lats[::scale].tolist()
+		lons = lons[::scale].tolist()
+		twd = twd[::scale, ::scale].tolist()
+		tws = tws[::scale, ::scale].tolist()
 
 		# Draw arrows
-		for x in data[::scale]:
-			for y in x[::scale]:
-				xx, yy = view.get_window_xy_from(y[2][0], y[2][1], zoom)
-				self.drawWindArrow(xx, yy, y[0], y[1])
+		for i, lat in enumerate(lats):
+			for j, lon in enumerate(lons):
+				xx, yy = view.get_window_xy_from(lat, lon, zoom)
+				self.drawWindArrow(xx, yy, twd[i][j], tws[i][j])
 
@@ -59,6 +59,8 @@ setup(name='gweatherrouting',
 	entry_points={
 		'console_scripts': [
 			'gweatherrouting=gweatherrouting.main:startUIGtk',
+			'gweatherrouting-gribcrop=gweatherrouting.core.gribcrop:main',
+			'gweatherrouting-route=gweatherrouting.core.routingrunner:main',
 			# 'gweatherrouting_cli=gweatherrouting.main:startCli'
 		],
 	},
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import tempfile
+import numpy
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'gweatherrouting'))
+
+# gweatherrouting storage lives in a temporary data directory, never the user one
+os.environ['XDG_DATA_HOME'] = tempfile.mkdtemp(prefix='gwrtest')
+
+# Area and run of the synthetic grib
+AREA = ((38., -2.), (42., 4.))
+RUN_DATE = 20260101
+
+
+# Write a GRIB2 file with U/V 10 m wind messages every 3 hours over AREA, with a
+# northerly wind turning and strengthening in time
+def writeGrib(path, steps=9, resolution=0.5):
+	import eccodes
+
+	(lat1, lon1), (lat2, lon2) = AREA
+	nlat = int(round((lat2 - lat1) / resolution)) + 1
+	nlon = int(round((lon2 - lon1) / resolution)) + 1
+
+	with open(path, 'wb') as f:
+		for s in range(steps):
+			h = s * 3
+			for pid, value in ((165, 2. + 0.2 * h), (166, -6. - 0.1 * h)):
+				gid = eccodes.codes_grib_new_from_samples('regular_ll_sfc_grib2')
+				eccodes.codes_set(gid, 'dataDate', RUN_DATE)
+				eccodes.codes_set(gid, 'dataTime', 0)
+				eccodes.codes_set(gid, 'Ni', nlon)
+				eccodes.codes_set(gid, 'Nj', nlat)
+				eccodes.codes_set(gid, 'latitudeOfFirstGridPointInDegrees', lat2)
+				eccodes.codes_set(gid, 'latitudeOfLastGridPointInDegrees', lat1)
+				eccodes.codes_set(gid, 'longitudeOfFirstGridPointInDegrees', lon1)
+				eccodes.codes_set(gid, 'longitudeOfLastGridPointInDegrees', lon2)
+				eccodes.codes_set(gid, 'iDirectionIncrementInDegrees', resolution)
+				eccodes.codes_set(gid, 'jDirectionIncrementInDegrees', resolution)
+				eccodes.codes_set(gid, 'jScansPositively', 0)
+				eccodes.codes_set(gid, 'paramId', pid)
+				eccodes.codes_set(gid, 'typeOfFirstFixedSurface', 103)
+				eccodes.codes_set(gid, 'scaledValueOfFirstFixedSurface', 10)
+				eccodes.codes_set(gid, 'forecastTime', h)
+				eccodes.codes_set_values(gid, numpy.full(nlat * nlon, value))
+				eccodes.codes_write(gid, f)
+				eccodes.codes_release(gid)
+
+
+@pytest.fixture(scope='session')
+def gribPath(tmp_path_factory):
+	path = str(tmp_path_factory.mktemp('grib') / 'test.grb')
+	writeGrib(path)
+	return path
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import pytest
+
+from gweatherrouting.core.grib import Grib
+
+
+# A grib holding only a 2 m temperature message
+@pytest.fixture
+def noWindPath(tmp_path):
+	import eccodes
+
+	path = str(tmp_path / 'temperature.grb')
+	with open(path, 'wb') as f:
+		gid = eccodes.codes_grib_new_from_samples('regular_ll_sfc_grib2')
+		eccodes.codes_set(gid, 'paramId', 167)
+		eccodes.codes_write(gid, f)
+		eccodes.codes_release(gid)
+	return path
+
+
+def test_parse(gribPath):
+	grib = Grib.parse(gribPath)
+	assert grib.startTime.year == 2026
+	assert grib.lastForecast == 24
+
+
+def test_parse_no_wind(noWindPath):
+	with pytest.raises(ValueError, match='no wind messages'):
+		Grib.parse(noWindPath)
+	with pytest.raises(ValueError, match='no wind messages'):
+		Grib.parseMetadata(noWindPath)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+from gweatherrouting.core.grib import Grib
+from gweatherrouting.core.gribmanager import GribCoverage
+
+
+def test_GribCoverage_within(gribPath):
+	c = GribCoverage(Grib.parseMetadata(gribPath))
+
+	assert c.within(((37., -3.), (43., 5.)))
+	assert c.within(((38., -2.), (42., 4.)))
+	# View crossing the antimeridian, from 150 E to 10 E
+	assert c.within(((30., 150.), (50., 10.)))
+
+	assert not c.within(((39., 0.), (41., 2.)))
+	assert not c.within(((37., -1.), (43., 5.)))
+	assert not c.within(((39., -3.), (43., 5.)))
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+import os
+
+from gweatherrouting.core.polartable import POLARS_DIR, polarPath
+
+
+# A polar of the working directory named as a bundled one must not replace it
+def test_polarPath_bundled_first(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	(tmp_path / 'bavaria38.pol').write_text('')
+
+	assert polarPath('bavaria38.pol') == POLARS_DIR + 'bavaria38.pol'
+
+
+def test_polarPath_custom(tmp_path):
+	path = str(tmp_path / 'custom.pol')
+	(tmp_path / 'custom.pol').write_text('')
+	assert polarPath(path) == path
+	assert os.path.exists(polarPath('bavaria38.pol'))
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+from gweatherrouting.core.routingrunner import JOB_DEFAULTS, getAlgorithm, runJob
+from gweatherrouting.core.isochronerouter import IsochroneRouter
+
+
+def job(gribPath, **kwargs):
+	j = dict(JOB_DEFAULTS)
+	j.update({
+		'name': 'test',
+		'gribs': [gribPath],
+		'polar': 'bavaria38.pol',
+		'algorithm': 'IsochroneRouter',
+		'track': [[39.0, -1.0], [39.4, 0.2]],
+		'start': '2026-01-01T00:00:00'
+	})
+	j.update(kwargs)
+	return j
+
+
+def test_getAlgorithm_params_are_per_job():
+	a = getAlgorithm('IsochroneRouter', { 'headingStep': 10.0 })
+	b = getAlgorithm('IsochroneRouter')
+
+	assert a.PARAMS['headingStep'].value == 10.0
+	assert b.PARAMS['headingStep'].value == IsochroneRouter.PARAMS['headingStep'].default
+	assert IsochroneRouter.PARAMS['headingStep'].value == IsochroneRouter.PARAMS['headingStep'].default
+
+
+# Two jobs through one process: the params of the first must not leak in the second
+def test_runJob_params_do_not_leak(gribPath):
+	before = runJob(job(gribPath))
+	coarse = runJob(job(gribPath, params={ 'headingStep': 30.0 }))
+	after = runJob(job(gribPath))
+
+	assert before['status'] == 'ok', before.get('error')
+	assert coarse['status'] == 'ok', coarse.get('error')
+	assert coarse['path'] != before['path']
+	assert after['path'] == before['path']
+
+
+def test_runJob_coastlineChecks(gribPath):
+	r = runJob(job(gribPath, track=[[39.0, 0.5], [39.4, 1.2]], coastlineChecks=True))
+	assert r['status'] == 'ok', r.get('error')
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+from gweatherrouting.core import utils
+
+
+def test_pointsValidity():
+	# Madrid, then the sea between Valencia and Ibiza
+	assert utils.pointsValidity([(40.4, -3.7), (39.2, 0.8)]) == [False, True]
+	assert utils.pointsValidity([]) == []
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017-2022 Davide Gessa
+'''
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+For detail about GNU see <http://www.gnu.org/licenses/>.
+'''
+
+# Grib benchmark: generate synthetic GRIB1 / GRIB2 wind files from the eccodes
+# sample templates and time parsing and wind queries on them.
+#
+#   python tools/gribbenchmark.py -o before.json
+#   python tools/gribbenchmark.py -o after.json -c before.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import platform
+import subprocess
+import tempfile
+import multiprocessing
+import numpy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'gweatherrouting'))
+
+# Area of the generated gribs (North Atlantic) unless --global is given
+AREA = ((0., -80.), (60., 20.))
+GLOBAL = ((-90., -180.), (90., 179.))
+RUN_DATE = 20260101
+
+
+# Write a grib with U/V 10 m wind messages every 3 hours over area
+def generate(path, edition, resolution, steps, area):
+	import eccodes
+
+	sample = 'regular_ll_sfc_grib2' if edition == 2 else 'regular_ll_sfc_grib1'
+	(lat1, lon1), (lat2, lon2) = area
+	nlat = int(round((lat2 - lat1) / resolution)) + 1
+	nlon = int(round((lon2 - lon1) / resolution)) + 1
+	lats = numpy.linspace(lat2, lat1, nlat)[:, None]
+	lons = numpy.linspace(lon1, lon1 + (nlon - 1) * resolution, nlon)[None, :]
+
+	with open(path, 'wb') as f:
+		for s in range(steps):
+			h = s * 3
+			for comp, pid in (('u', 165), ('v', 166)):
+				gid = eccodes.codes_grib_new_from_samples(sample)
+				eccodes.codes_set(gid, 'dataDate', RUN_DATE)
+				eccodes.codes_set(gid, 'dataTime', 0)
+				eccodes.codes_set(gid, 'Ni', nlon)
+				eccodes.codes_set(gid, 'Nj', nlat)
+				eccodes.codes_set(gid, 'latitudeOfFirstGridPointInDegrees', lat2)
+				eccodes.codes_set(gid, 'latitudeOfLastGridPointInDegrees', lat1)
+				eccodes.codes_set(gid, 'longitudeOfFirstGridPointInDegrees', lon1)
+				eccodes.codes_set(gid, 'longitudeOfLastGridPointInDegrees', lon1 + (nlon - 1) * resolution)
+				eccodes.codes_set(gid, 'iDirectionIncrementInDegrees', resolution)
+				eccodes.codes_set(gid, 'jDirectionIncrementInDegrees', resolution)
+				eccodes.codes_set(gid, 'jScansPositively', 0)
+				eccodes.codes_set(gid, 'paramId', pid)
+
+				if edition == 2:
+					eccodes.codes_set(gid, 'typeOfFirstFixedSurface', 103)
+					eccodes.codes_set(gid, 'scaledValueOfFirstFixedSurface', 10)
+					eccodes.codes_set(gid, 'forecastTime', h)
+				else:
+					eccodes.codes_set(gid, 'indicatorOfTypeOfLevel', 105)
+					eccodes.codes_set(gid, 'level', 10)
+					eccodes.codes_set(gid, 'P1', h)
+
+				phase = 0. if comp == 'u' else 1.3
+				values = 8. * numpy.sin(numpy.radians(lats * 3. + h * 2. + phase * 40.)) * \
+					numpy.cos(numpy.radians(lons * 2. - h * 3.)) + 2.
+				eccodes.codes_set_values(gid, numpy.broadcast_to(values, (nlat, nlon)).ravel())
+				eccodes.codes_write(gid, f)
+				eccodes.codes_release(gid)
+
+
+# Generate a fixture in a spawned process, keeping the encoder out of the
+# benchmarked one
+def generateFixture(path, edition, resolution, steps, area):
+	p = multiprocessing.get_context('spawn').Process(target=generate, args=(path, edition, resolution, steps, area))
+	p.start()
+	p.join()
+	if p.exitcode != 0 or not os.path.exists(path):
+		raise Exception(f'Unable to generate {path}')
+
+
+def removeSidecars(path):
+	from gweatherrouting.core.gribcache import GribCache
+
+	for x in GribCache.files(path):
+		if os.path.exists(x):
+			os.remove(x)
+
+
+# Run f n times and return the mean time in seconds
+def timeit(f, n=1):
+	t0 = time.perf_counter()
+	for _ in range(n):
+		f()
+	return (time.perf_counter() - t0) / n
+
+
+def bench(path, area, queries, points):
+	from gweatherrouting.core.grib import Grib, filePool
+	from gweatherrouting.core import GribManager
+
+	r = {}
+	rnd = numpy.random.default_rng(42)
+	(lat1, lon1), (lat2, lon2) = area
+	box = ((lat1 + (lat2 - lat1) * 0.25, lon1 + (lon2 - lon1) * 0.25),
+		(lat1 + (lat2 - lat1) * 0.75, lon1 + (lon2 - lon1) * 0.75))
+
+	removeSidecars(path)
+	filePool.release(path)
+	r['parse'] = timeit(lambda: Grib.parse(path))
+	r['parseCached'] = timeit(lambda: Grib.parse(path))
+
+	# Cold: sidecar cache empty, every step touched must be decoded
+	removeSidecars(path)
+	grib = Grib.parse(path)
+	start = grib.startTime
+	last = grib.lastForecast
+	t = start + datetime.timedelta(hours=last / 2. + 1.)
+	r['coldQuery'] = timeit(lambda: grib.getWindGrid(t, box))
+
+	# Warm: decoded steps resident, new interpolated time each query
+	times = [start + datetime.timedelta(hours=last / 2. + 1. + 0.01 * (i + 1)) for i in range(queries)]
+	it = iter(times)
+	r['warmQuery'] = timeit(lambda: grib.getWindGrid(next(it), box), queries)
+	r['cachedQuery'] = timeit(lambda: grib.getWindGrid(t, box), queries)
+	r['getWind'] = timeit(lambda: grib.getWind(t, box), max(1, queries // 10))
+
+	gm = GribManager(bare=True)
+	gm.gribs = [grib]
+	r['getWind2D'] = timeit(lambda: gm.getWind2D(t, box), queries)
+
+	lats = rnd.uniform(box[0][0], box[1][0], points)
+	lons = rnd.uniform(box[0][1], box[1][1], points)
+	n = min(points, 2000)
+	r['getWindAt'] = timeit(lambda: [grib.getWindAt(t, lats[i], lons[i]) for i in range(n)]) / n
+	r['batchQuery'] = timeit(lambda: grib.getWindAtBatch(t, lats, lons), max(1, queries // 10))
+	r['batchPerPoint'] = r['batchQuery'] / points
+
+	removeSidecars(path)
+	return r
+
+
+def compare(results, old):
+	index = { (x['edition'], x['resolution'], x['steps']): x for x in old['results'] }
+	for x in results['results']:
+		o = index.get((x['edition'], x['resolution'], x['steps']))
+		if not o:
+			continue
+
+		print(f"GRIB{x['edition']} {x['resolution']}° {x['steps']} steps")
+		for k, v in x['timings'].items():
+			if k in o['timings'] and o['timings'][k] > 0:
+				ratio = v / o['timings'][k]
+				flag = '  slower' if ratio > 1.1 else ('  faster' if ratio < 0.9 else '')
+				print(f'  {k:14s} {o["timings"][k]*1000:12.3f} ms -> {v*1000:12.3f} ms  x{ratio:.2f}{flag}')
+
+
+def gitCommit():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+	except Exception:
+		return None
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark grib parsing and wind queries on synthetic gribs')
+	parser.add_argument('-r', '--resolutions', nargs='+', type=float, default=[1.0, 0.5, 0.25])
+	parser.add_argument('-s', '--steps', nargs='+', type=int, default=[9, 41], help='forecast steps (3h apart)')
+	parser.add_argument('-e', '--editions', nargs='+', type=int, default=[1, 2])
+	parser.add_argument('-q', '--queries', type=int, default=50, help='repetitions of the warm queries')
+	parser.add_argument('-p', '--points', type=int, default=100000, help='points of the batch query')
+	parser.add_argument('-g', '--global', dest='globalArea', action='store_true', help='generate global gribs')
+	parser.add_argument('-w', '--workdir', help='directory for the generated gribs (default: a temporary one)')
+	parser.add_argument('-o', '--output', help='write results as JSON to this file')
+	parser.add_argument('-c', '--compare', help='compare with a previous JSON result')
+	args = parser.parse_args()
+
+	# Run on a temporary data directory holding only the synthetic gribs, so the
+	# user storage and GRIB_DIR are neither read nor rewritten; it must be set
+	# before gweatherrouting is imported
+	datadir = tempfile.mkdtemp(prefix='gribbenchdata')
+	os.environ['XDG_DATA_HOME'] = datadir
+	os.environ['HOME'] = datadir
+
+	# eccodes is imported after gweatherrouting, as the application does
+	from gweatherrouting.core.utils.storage import GRIB_DIR
+	import eccodes
+
+	if not os.path.abspath(GRIB_DIR).startswith(datadir):
+		shutil.rmtree(datadir, ignore_errors=True)
+		sys.exit('Unable to run on a temporary data directory on this platform')
+
+	area = GLOBAL if args.globalArea else AREA
+	workdir = args.workdir or tempfile.mkdtemp(prefix='gribbench')
+	os.makedirs(workdir, exist_ok=True)
+
+	results = {
+		'commit': gitCommit(),
+		'date': datetime.datetime.now().isoformat(),
+		'python': platform.python_version(),
+		'eccodes': eccodes.codes_get_api_version(),
+		'machine': platform.machine(),
+		'cpus': os.cpu_count(),
+		'area': area,
+		'results': []
+	}
+
+	try:
+		for edition in args.editions:
+			for resolution in args.resolutions:
+				for steps in args.steps:
+					path = os.path.join(workdir, f'bench_e{edition}_r{resolution}_s{steps}.grb')
+					if not os.path.exists(path):
+						generateFixture(path, edition, resolution, steps, area)
+
+					timings = bench(path, area, args.queries, args.points)
+					results['results'].append({
+						'edition': edition,
+						'resolution': resolution,
+						'steps': steps,
+						'fileSize': os.path.getsize(path),
+						'timings': timings
+					})
+					print(f'GRIB{edition} {resolution}° {steps} steps: ' +
+						', '.join(f'{k} {v*1000:.3f}ms' for k, v in timings.items()))
+	finally:
+		if not args.workdir:
+			shutil.rmtree(workdir, ignore_errors=True)
+		shutil.rmtree(datadir, ignore_errors=True)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			f.write(json.dumps(results, indent=2))
+
+	if args.compare:
+		with open(args.compare, 'r') as f:
+			compare(results, json.loads(f.read()))
+
+
+if __name__ == '__main__':
+	main()